@@ -0,0 +1,271 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+from pymarc import Field, Record, Subfield, XMLWriter
+
+from count_cube import build_cube
+from marc_fields import field_list, table_columns
+from marc_table import TableWriter
+from mrc_index import build_index, count_records, year_range
+from ragged import load_ragged
+from record_cache import RecordCache, extracted_batches
+from split_databases import is_clb, routes_uclo, split
+
+# Mereni rychlosti jednotlivych kroku zpracovani na umele vytvorenych datech:
+# split (deleni exportu na databaze), extract (vytazeni sloupcu do tabulky), count (pocty zaznamu
+# a rozsah let z indexu) a aggregate (pocty hodnot po letech). Kazdy krok bezi ve vlastnim procesu,
+# aby slo zmerit jeho nejvetsi spotrebu pameti (peak RSS). Vysledky se ukladaji do JSON,
+# takze se daji porovnat dva behy (--compare).
+# Pouziti: python benchmark.py --records 100000
+
+benchmark_directory = 'data/benchmark'
+results_directory = 'data/benchmarks'
+
+# Kroky v poradi, v jakem se spousti (kazdy pouziva vystup predchoziho)
+stages = ['split', 'extract', 'count', 'aggregate']
+
+# Kody z pole 964 a jak casto se v exportu objevuji
+codes = [('B45', 30), ('B12', 5), ('B70', 5), ('B80', 5), ('B97', 5), ('CLE', 30),
+         ('SMZ', 10), ('INT', 10), ('RET', 10), ('TRL', 5), ('ALKARO', 3)]
+
+genres = ['studie', 'recenze', 'rozhovory', 'medailony', 'poezie', 'próza', 'fejetony', 'nekrology']
+descriptions = ['česká literatura', 'exilová literatura', 'literární kritika', 'česká poezie', 'česká próza',
+                'literární život', 'samizdat', 'překlady']
+magazines = ['Svědectví (Paříž)', 'Listy (Řím)', 'Proměny (New York)', 'Studie (Řím)', 'Rozmluvy (London)',
+             'Obrys (Mnichov)', 'Perspektivy (Köln-Ehrenfeld)', 'Reportér (Ženeva-Middlesex-Mnichov)',
+             'Paternoster (Wintertuhr-Obstladen)', 'Západ (Ottawa)', 'Text', 'Archa']
+
+
+# Jmeno osoby a jeji autoritni kod. Nektere osoby jsou mnohem castejsi nez jine,
+# stejne jako ve skutecnych datech
+def person(generator, people):
+    i = min(int(generator.paretovariate(1.2)) - 1, people - 1)
+    return ('Příjmení{}, Jméno{},'.format(i, i % 97), 'jk{:07d}'.format(i))
+
+
+def subfield_field(tag, indicators, subfields):
+    return Field(tag=tag, indicators=indicators, subfields=[Subfield(code, value) for (code, value) in subfields])
+
+
+# Umely zaznam se stejnou strukturou jako zaznamy z exportu katalogu
+def synthetic_record(generator, i, people=5000):
+    r = Record()
+    r.add_field(Field(tag='001', data='bib{:09d}'.format(i)))
+    r.add_field(Field(tag='005', data='20240101120000.0'))
+    year = str(generator.randint(1948, 2023)) if generator.random() > 0.02 else '19uu'
+    r.add_field(Field(tag='008', data='240101s' + year + '    xr ||||| |||||||||||||cze d'))
+
+    record_codes = set(generator.choices([code for (code, _) in codes], [weight for (_, weight) in codes],
+                                         k=generator.choice([1, 1, 2, 3])))
+    if 'CLE' in record_codes:
+        number = generator.randint(0, 999999)
+        prefix = generator.choice(['1', '2', '001', '002'])
+        r.add_field(subfield_field('035', [' ', ' '], [('a', '(CLE)' + prefix + '{:06d}'.format(number))]))
+
+    (name, code) = person(generator, people)
+    r.add_field(subfield_field('100', ['1', ' '], [('a', name), ('4', 'aut'), ('7', code)]))
+    r.add_field(subfield_field('245', ['1', '0'], [('a', 'Název článku {} /'.format(i)), ('c', name.rstrip(','))]))
+    if generator.random() < 0.9:
+        r.add_field(subfield_field('599', [' ', ' '], [('a', 'CLB-CPK')]))
+    for _ in range(generator.randint(0, 3)):
+        (name, code) = person(generator, people)
+        r.add_field(subfield_field('600', ['1', '7'], [('a', name), ('7', code), ('2', 'czenas')]))
+    for description in generator.sample(descriptions, generator.randint(0, 2)):
+        r.add_field(subfield_field('650', [' ', '7'], [('a', description), ('2', 'czenas')]))
+    r.add_field(subfield_field('655', [' ', '7'], [('a', generator.choice(genres)), ('2', 'czenas')]))
+    if generator.random() < 0.7:
+        r.add_field(subfield_field('773', ['0', ' '], [('t', generator.choice(magazines)),
+                                                      ('g', 'Roč. {}, č. {}'.format(generator.randint(1, 40),
+                                                                                   generator.randint(1, 12)))]))
+    for record_code in sorted(record_codes):
+        r.add_field(subfield_field('964', [' ', ' '], [('a', record_code)]))
+    return r
+
+
+def synthetic_records(count, seed=0):
+    generator = random.Random(seed)
+    for i in range(count):
+        yield synthetic_record(generator, i)
+
+
+# Ulozi umele zaznamy jako MARCXML (.xml) nebo ISO 2709 (.mrc) podle pripony souboru
+def write_synthetic(path, count, seed=0):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if os.path.splitext(path)[1].lower() == '.xml':
+        writer = XMLWriter(open(path, 'wb'))
+        for r in synthetic_records(count, seed):
+            writer.write(r)
+        writer.close()
+    else:
+        with open(path, 'wb') as out:
+            for r in synthetic_records(count, seed):
+                out.write(r.as_marc())
+    return path
+
+
+# Umela data se vytvori jen jednou pro kazdy pocet zaznamu a seed. Parametry posledniho
+# vytvoreni jsou v <soubor>.json, pri shode se existujici soubor pouzije znovu
+def prepare_synthetic(path, count, seed=0):
+    parameters = {'records': count, 'seed': seed}
+    try:
+        with open(path + '.json', encoding='utf8') as file:
+            if os.path.exists(path) and json.load(file) == parameters:
+                return path
+    except (OSError, ValueError):
+        pass
+    write_synthetic(path, count, seed)
+    with open(path + '.json', 'w', encoding='utf8') as file:
+        json.dump(parameters, file)
+    return path
+
+
+def paths(directory):
+    return {'xml': os.path.join(directory, 'uclo.xml'),
+            'mrc': os.path.join(directory, 'uclo', 'uclo_{}.mrc'),
+            'table': os.path.join(directory, 'csv', 'uclo_1945.csv'),
+            'cache': os.path.join(directory, 'cache')}
+
+
+# Split cte vsechny vytvorene zaznamy (i ty, ktere se nikam nezapisou), pocet zaznamu je tedy records
+def run_split(directory, processes, records):
+    p = paths(directory)
+    split(p['xml'], routes_uclo, [p['mrc']], is_clb, processes)
+    return records
+
+
+def run_extract(directory, processes, records):
+    p = paths(directory)
+    cache = RecordCache(p['cache'])
+    cache.clear()
+    records = 0
+    writer = TableWriter(p['table'], table_columns(field_list))
+    for batch in extracted_batches(p['mrc'].format('1945'), field_list, cache=cache):
+        writer.write_batch(batch)
+        records += len(batch['title'])
+    writer.close()
+    cache.close()
+    return records
+
+
+def run_count(directory, processes, records):
+    p = paths(directory)
+    records = 0
+    for (name, _, _) in routes_uclo:
+        index = build_index(p['mrc'].format(name), save=False)
+        year_range(index)
+        records += count_records(index)
+    return records
+
+
+def run_aggregate(directory, processes, records):
+    df = load_ragged(paths(directory)['table'])
+    build_cube({'1945': df})
+    return len(df)
+
+
+stage_functions = {'split': run_split,
+                   'extract': run_extract,
+                   'count': run_count,
+                   'aggregate': run_aggregate}
+
+
+# Nejvetsi spotreba pameti procesu (a jeho podprocesu) v MiB. Linux vraci ru_maxrss v KiB, macOS v bajtech
+def peak_rss():
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(queue, stage, directory, processes, records):
+    start = time.perf_counter()
+    records = stage_functions[stage](directory, processes, records)
+    queue.put((records, time.perf_counter() - start, peak_rss()))
+
+
+# Spusti krok v novem procesu (spawn, aby proces nezdedil pamet hlavniho procesu).
+# Z vice opakovani se bere nejrychlejsi beh a nejvetsi spotreba pameti
+def run_stage(stage, directory, records, processes=1, repeat=1):
+    context = multiprocessing.get_context('spawn')
+    best = None
+    rss = 0
+    for _ in range(repeat):
+        queue = context.Queue()
+        process = context.Process(target=measure, args=(queue, stage, directory, processes, records))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError("Stage " + stage + " failed")
+        (stage_records, seconds, stage_rss) = queue.get()
+        best = seconds if best is None else min(best, seconds)
+        rss = max(rss, stage_rss)
+    return {'records': stage_records, 'seconds': round(best, 4),
+            'records per second': round(stage_records / best, 1) if best > 0 else None,
+            'peak rss mib': round(rss, 1)}
+
+
+def run_benchmark(records, seed=0, directory=benchmark_directory, processes=1, repeat=1, selected=stages):
+    # Umela data cte jen split, ostatni kroky pouzivaji jeho vystupy
+    if 'split' in selected:
+        prepare_synthetic(paths(directory)['xml'], records, seed)
+    results = {}
+    for stage in stages:
+        if stage in selected:
+            results[stage] = run_stage(stage, directory, records, processes, repeat)
+            print("{:<10} {:>9} records {:>9.3f} s {:>11.0f} records/s {:>8.1f} MiB".format(
+                stage, results[stage]['records'], results[stage]['seconds'],
+                results[stage]['records per second'] or 0, results[stage]['peak rss mib']))
+    return {'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'records': records,
+            'seed': seed,
+            'processes': processes,
+            'repeat': repeat,
+            'stages': results}
+
+
+# Porovnani s predchozim behem: kolikrat je kazdy krok rychlejsi (> 1) nebo pomalejsi (< 1)
+def compare(result, previous):
+    for (stage, values) in result['stages'].items():
+        old = previous['stages'].get(stage)
+        if old is None or not old['records per second'] or not values['records per second']:
+            continue
+        print("{:<10} {:>6.2f}x speed, {:+.1f} MiB peak RSS".format(
+            stage, values['records per second'] / old['records per second'],
+            values['peak rss mib'] - old['peak rss mib']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic MARC records.")
+    parser.add_argument('--records', type=int, default=10000, help="number of synthetic records")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='*', choices=stages, default=stages,
+                        help="stages to time (the previous stages must have run before)")
+    parser.add_argument('--processes', type=int, default=1, help="worker processes for split (0 = all cores)")
+    parser.add_argument('--repeat', type=int, default=1, help="run every stage several times, keep the fastest")
+    parser.add_argument('--directory', default=benchmark_directory, help="directory for the generated data")
+    parser.add_argument('--output', default=None, help="results .json (default: data/benchmarks/<date>.json)")
+    parser.add_argument('--compare', default=None, help="results .json of a previous run")
+    arguments = parser.parse_args()
+
+    result = run_benchmark(arguments.records, arguments.seed, arguments.directory,
+                           arguments.processes or None, arguments.repeat, arguments.stages)
+    output = arguments.output or os.path.join(results_directory, time.strftime('%Y%m%d_%H%M%S') + '.json')
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, 'w', encoding='utf8') as file:
+        json.dump(result, file, indent=2, ensure_ascii=False)
+    print("Results saved to " + output)
+    if arguments.compare:
+        with open(arguments.compare, encoding='utf8') as file:
+            compare(result, json.load(file))
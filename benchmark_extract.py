@@ -0,0 +1,74 @@
+import sys
+import time
+
+from pymarc import MARCReader
+
+from marc_fields import field_list, compile_field_list
+
+# Srovnani puvodni funkce save_to_dict ze save_csv.py s extrakci pres compile_field_list.
+# Pouziti: python benchmark_extract.py [cesta k .mrc]
+database = 'data/ucla/ucla_ret.mrc'
+
+
+# Puvodni verze save_to_dict (pro kazde podpole prevadi cele pole na text)
+def legacy_save_to_dict(record, dict, field_list):
+    if not record is None:
+        try:
+            for field_tags in field_list:
+                dict_key_name = field_tags[0]
+                tag = field_tags[1]
+                subfield_tag = field_tags[2]
+                dict_add_list = []
+                for field in record.get_fields(tag):
+                    if subfield_tag is None:
+                        dict_add_list.append(field.data)
+                    elif isinstance(subfield_tag, slice):
+                        dict_add_list.append(field.data[subfield_tag])
+                    elif '$' + subfield_tag in str(field):
+                        dict_add_list.append(str(field[subfield_tag]))
+                dict[dict_key_name].append(dict_add_list)
+        except Exception as error:
+            print("Exception: " + type(error).__name__)
+            print("LDR: " + str(record.leader))
+    return dict
+
+
+def compiled_save_to_dict(record, dict, extract):
+    if not record is None:
+        for dict_key_name, dict_add_list in extract(record).items():
+            dict[dict_key_name].append(dict_add_list)
+    return dict
+
+
+def empty_dict():
+    return {t[0]: [] for t in field_list}
+
+
+def run(function, records, argument, repeat=3):
+    best = None
+    for _ in range(repeat):
+        dict = empty_dict()
+        start = time.perf_counter()
+        for record in records:
+            dict = function(record, dict, argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return (best, dict)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        database = sys.argv[1]
+
+    # Zaznamy nacteme predem, abychom merili jen samotnou extrakci
+    with open(database, 'rb') as data:
+        records = [record for record in MARCReader(data) if record is not None]
+    print("Records: " + str(len(records)))
+
+    (legacy_time, legacy_dict) = run(legacy_save_to_dict, records, field_list)
+    (compiled_time, compiled_dict) = run(compiled_save_to_dict, records, compile_field_list(field_list))
+
+    print("save_to_dict:       {:.3f} s ({:.0f} records/s)".format(legacy_time, len(records) / legacy_time))
+    print("compile_field_list: {:.3f} s ({:.0f} records/s)".format(compiled_time, len(records) / compiled_time))
+    print("Speedup: {:.2f}x".format(legacy_time / compiled_time))
+    print("Same output: " + str(legacy_dict == compiled_dict))
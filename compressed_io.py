@@ -0,0 +1,330 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Cteni a zapis komprimovanych souboru podle pripony (.gz, .bz2, .xz, .zst). Exporty z katalogu
+# (ucla.xml.gz, ...) se ctou primo, bez rozbaleni na disk. Rozbalovani bezi ve vlakne na pozadi,
+# takze parser zpracovava jeden blok, zatimco se rozbaluje dalsi.
+#
+# Vystupy se komprimuji po blocich: kazdy blok (block_size nekomprimovanych bajtu) je samostatny
+# gzip/bz2/xz/zstd ramec. Soubor je tak porad platny pro bezne nastroje (zcat, pandas, ...),
+# a protoze si vedle souboru ulozime tabulku bloku (<soubor>.blocks.npy), jde cist i od libovolne
+# pozice (napr. jeden zaznam podle indexu z mrc_index.py) rozbalenim jen jednoho bloku.
+# Balicek zstandard je potreba jen pro soubory .zst.
+
+# Velikost nekomprimovaneho bloku pri zapisu
+block_size = 1024 * 1024
+
+# Velikost bloku, ktery rozbali vlakno na pozadi, a pocet bloku, ktere muzou cekat ve fronte
+read_size = 1024 * 1024
+queue_size = 8
+
+# Tabulka bloku: pozice bloku v komprimovanem souboru a pozice jeho zacatku v rozbalenych datech
+blocks_dtype = np.dtype([('compressed', '<u8'), ('offset', '<u8')])
+
+
+def zstd_open(file):
+    import zstandard
+
+    return zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True)
+
+
+def zstd_compress(data):
+    import zstandard
+
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def zstd_decompress(data):
+    import zstandard
+
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# {pripona: (otevreni komprimovaneho proudu pro cteni, komprimace bloku, rozbaleni bloku)}
+codecs = {'.gz': (lambda file: gzip.GzipFile(fileobj=file, mode='rb'), gzip.compress, gzip.decompress),
+          '.bz2': (lambda file: bz2.BZ2File(file, 'rb'), bz2.compress, bz2.decompress),
+          '.xz': (lambda file: lzma.LZMAFile(file, 'rb'), lzma.compress, lzma.decompress),
+          '.zst': (zstd_open, zstd_compress, zstd_decompress)}
+
+
+def compression(path):
+    extension = os.path.splitext(path)[1].lower()
+    return extension if extension in codecs else None
+
+
+def is_compressed(path):
+    return compression(path) is not None
+
+
+# Cesta bez pripony komprese, napr. data/ucla.xml.gz -> data/ucla.xml (podle ni se urci format)
+def base_path(path):
+    return os.path.splitext(path)[0] if is_compressed(path) else path
+
+
+def blocks_path(path):
+    return path + '.blocks.npy'
+
+
+# Rozbalena data z komprimovaneho proudu. Vlakno na pozadi cte a rozbaluje bloky do fronty,
+# read() si je z fronty bere. Chyba pri rozbalovani se vyhodi az v read()
+class BackgroundReader(io.RawIOBase):
+    def __init__(self, stream, raw):
+        self.stream = stream
+        self.raw = raw
+        self.queue = queue.Queue(queue_size)
+        self.buffer = b''
+        self.offset = 0
+        self.position = 0
+        self.finished = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self.fill, daemon=True)
+        self.thread.start()
+
+    def fill(self):
+        try:
+            while not self.stopped:
+                block = self.stream.read(read_size)
+                self.queue.put(block)
+                if not block:
+                    return
+        except Exception as error:
+            self.queue.put(error)
+
+    def next_block(self):
+        block = self.queue.get()
+        if isinstance(block, Exception):
+            raise block
+        if not block:
+            self.finished = True
+        return block
+
+    def readable(self):
+        return True
+
+    # Rozbaleny blok se necha cely v bufferu a cte se z nej od pozice offset. Pri malych ctenich
+    # (MARCReader cte dve male casti na zaznam) se tak kopiruji jen prectena data, ne zbytek bloku
+    def read(self, size=-1):
+        if size is None or size < 0:
+            blocks = [self.buffer[self.offset:]]
+            while not self.finished:
+                blocks.append(self.next_block())
+            data = b''.join(blocks)
+            self.buffer = b''
+            self.offset = 0
+        elif self.offset + size <= len(self.buffer):
+            data = self.buffer[self.offset:self.offset + size]
+            self.offset += size
+        else:
+            parts = [self.buffer[self.offset:]]
+            missing = size - len(parts[0])
+            self.buffer = b''
+            self.offset = 0
+            while missing > 0 and not self.finished:
+                block = self.next_block()
+                if len(block) > missing:
+                    parts.append(block[:missing])
+                    self.buffer = block
+                    self.offset = missing
+                    break
+                parts.append(block)
+                missing -= len(block)
+            data = b''.join(parts)
+        self.position += len(data)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        memoryview(b)[:len(data)] = data
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    # Pozice v komprimovanem souboru (pro odhad zbyvajiciho casu podle velikosti souboru)
+    def raw_position(self):
+        return self.raw.tell()
+
+    def close(self):
+        if not self.closed:
+            self.stopped = True
+            # Uvolnime frontu, aby vlakno nezustalo viset na put()
+            while self.thread.is_alive():
+                try:
+                    self.queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.stream.close()
+            self.raw.close()
+        super().close()
+
+
+# Otevre soubor pro cteni (binarne). Komprimovane soubory se rozbaluji ve vlakne na pozadi
+def open_input(path, background=True):
+    codec = compression(path)
+    if codec is None:
+        return open(path, 'rb')
+    raw = open(path, 'rb')
+    stream = codecs[codec][0](raw)
+    return BackgroundReader(stream, raw) if background else stream
+
+
+# Pozice ve vstupnim souboru (u komprimovanych souboru v komprimovanych datech)
+def input_position(file):
+    if isinstance(file, BackgroundReader):
+        return file.raw_position()
+    return file.tell()
+
+
+# Zapis po samostatne komprimovanych blocich. Pri zavreni se ulozi tabulka bloku
+class BlockWriter(io.BufferedIOBase):
+    def __init__(self, path, size=None):
+        self.path = path
+        self.compress = codecs[compression(path)][1]
+        self.block_size = size or block_size
+        self.file = open(path, 'wb')
+        self.buffer = bytearray()
+        self.blocks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self.write_block(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def write_block(self, data):
+        self.blocks.append((self.file.tell(), self.position))
+        self.file.write(self.compress(data))
+        self.position += len(data)
+
+    # Pozice v nekomprimovanych datech
+    def tell(self):
+        return self.position + len(self.buffer)
+
+    def close(self):
+        if not self.closed:
+            if self.buffer:
+                self.write_block(bytes(self.buffer))
+                self.buffer = bytearray()
+            self.file.close()
+            np.save(blocks_path(self.path), np.array(self.blocks, dtype=blocks_dtype))
+        super().close()
+
+
+# Otevre soubor pro zapis. Komprimovane soubory se zapisuji po blocich (viz BlockWriter).
+# Mody jako u open(): 'wb' binarne, 'w' nebo 'wt' jako text
+def open_output(path, mode='wb', **kwargs):
+    if not is_compressed(path):
+        return open(path, mode, **kwargs)
+    writer = BlockWriter(path)
+    if 'b' in mode:
+        return writer
+    return io.TextIOWrapper(writer, **kwargs)
+
+
+# Tabulka bloku komprimovaneho souboru, nebo None, pokud soubor nebyl zapsan po blocich
+def read_blocks(path):
+    path = blocks_path(path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(path[:-len('.blocks.npy')]):
+        return np.load(path)
+    return None
+
+
+# Precte length bajtu od pozice offset (v rozbalenych datech). U souboru zapsanych po blocich
+# se rozbali jen bloky, ve kterych data jsou, jinak se soubor rozbaluje od zacatku
+def read_range(path, offset, length):
+    codec = compression(path)
+    if codec is None:
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            return file.read(length)
+
+    blocks = read_blocks(path)
+    if blocks is None:
+        with open_input(path, background=False) as file:
+            file.read(offset)
+            return file.read(length)
+
+    decompress = codecs[codec][2]
+    first = max(int(np.searchsorted(blocks['offset'], offset, side='right')) - 1, 0)
+    data = []
+    with open(path, 'rb') as file:
+        end = os.fstat(file.fileno()).st_size
+        for i in range(first, len(blocks)):
+            if blocks['offset'][i] >= offset + length:
+                break
+            file.seek(int(blocks['compressed'][i]))
+            next_block = int(blocks['compressed'][i + 1]) if i + 1 < len(blocks) else end
+            data.append(decompress(file.read(next_block - int(blocks['compressed'][i]))))
+    data = b''.join(data)
+    start = offset - int(blocks['offset'][first]) if len(blocks) > 0 else 0
+    return data[start:start + length]
+
+
+# Rozbalena data souboru zapsaneho po blocich jako buffer pro nahodny pristup (napr. pro mrc_mmap.py):
+# buffer[a:b] rozbali jen bloky, ve kterych data jsou. Nekolik naposledy pouzitych bloku se pamatuje,
+# takze pri postupnem cteni se kazdy blok rozbali jen jednou a v pameti neni cely soubor
+class BlockBuffer:
+    def __init__(self, path, cached_blocks=4):
+        self.blocks = read_blocks(path)
+        if self.blocks is None:
+            raise ValueError(path + " was not written in blocks (missing " + blocks_path(path) + ")")
+        self.decompress = codecs[compression(path)][2]
+        self.file = open(path, 'rb')
+        self.end = os.fstat(self.file.fileno()).st_size
+        self.cached_blocks = cached_blocks
+        self.cache = OrderedDict()
+        self.size = None
+
+    def block(self, i):
+        data = self.cache.get(i)
+        if data is not None:
+            self.cache.move_to_end(i)
+            return data
+        start = int(self.blocks['compressed'][i])
+        next_block = int(self.blocks['compressed'][i + 1]) if i + 1 < len(self.blocks) else self.end
+        self.file.seek(start)
+        data = self.decompress(self.file.read(next_block - start))
+        self.cache[i] = data
+        if len(self.cache) > self.cached_blocks:
+            self.cache.popitem(last=False)
+        return data
+
+    # Velikost rozbalenych dat (rozbali se kvuli tomu posledni blok)
+    def __len__(self):
+        if self.size is None:
+            last = len(self.blocks) - 1
+            self.size = int(self.blocks['offset'][last]) + len(self.block(last)) if last >= 0 else 0
+        return self.size
+
+    # Jen rezy (jako u memoryview), data pres vice bloku se spoji
+    def __getitem__(self, key):
+        (start, stop, _) = key.indices(len(self))
+        if stop <= start:
+            return memoryview(b'')
+        first = int(np.searchsorted(self.blocks['offset'], start, side='right')) - 1
+        parts = []
+        for i in range(first, len(self.blocks)):
+            if self.blocks['offset'][i] >= stop:
+                break
+            parts.append(self.block(i))
+        base = int(self.blocks['offset'][first])
+        data = parts[0] if len(parts) == 1 else b''.join(parts)
+        return memoryview(data)[start - base:stop - base]
+
+    # Stejne jako memoryview.release()
+    def release(self):
+        self.cache.clear()
+        self.file.close()
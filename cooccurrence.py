@@ -0,0 +1,105 @@
+import argparse
+import os
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from ragged import load_ragged, ragged
+
+# Grafy spolecneho vyskytu hodnot ze dvou sloupcu (napr. autor a casopis, autor a osobnost).
+# Misto prochazeni radku (iterrows) pro kazdou dvojici se kazdy sloupec jednou "rozbali"
+# do ridke matice vyskytu zaznam x hodnota. Vahy hran jsou pak soucin matic:
+# (autor x zaznam) . (zaznam x casopis) = pocet zaznamu, kde se autor a casopis potkali.
+
+# Grafy, ktere se vytvori z prikazove radky: (sloupec, sloupec)
+graphs = [('author', 'magazine name'),
+          ('author', 'figures'),
+          ('figures', 'figures')]
+
+
+# Ridka matice vyskytu zaznam x hodnota ze sloupce column a hodnoty odpovidajici sloupcum matice.
+# Na pozici (zaznam, hodnota) je pocet vyskytu hodnoty v zaznamu.
+# df muze byt DataFrame s listy v bunkach i RaggedTable (viz ragged.py)
+def incidence(df, column):
+    from scipy import sparse
+
+    values = ragged(df[column]).compact()
+    matrix = sparse.csr_matrix((np.ones(len(values.codes), dtype=np.int64), (values.rows(), values.codes)),
+                               shape=(len(values), len(values.labels)))
+    return (matrix, pd.Index(values.labels, dtype=object))
+
+
+# Matice vah hran hodnota x hodnota. U grafu jednoho sloupce (napr. osobnost s osobnosti)
+# se bere jen horni trojuhelnik bez diagonaly, aby kazda dvojice byla jen jednou
+def cooccurrence(df, left, right):
+    from scipy import sparse
+
+    (left_matrix, left_labels) = incidence(df, left)
+    if right == left:
+        weights = sparse.triu(left_matrix.T @ left_matrix, k=1)
+        return (weights.tocoo(), left_labels, left_labels)
+    (right_matrix, right_labels) = incidence(df, right)
+    return ((left_matrix.T @ right_matrix).tocoo(), left_labels, right_labels)
+
+
+# Hrany jako tabulka (source, target, weight) serazena od nejvetsi vahy.
+# Pokud je zadano top, zustanou jen hrany top nejcastejsich hodnot z leveho sloupce
+def edge_table(df, left, right, threshold=1, top=None):
+    (weights, left_labels, right_labels) = cooccurrence(df, left, right)
+    keep = weights.data >= threshold
+    if top is not None:
+        (left_matrix, _) = incidence(df, left)
+        counts = np.asarray(left_matrix.sum(axis=0)).ravel()
+        most_common = np.argsort(-counts, kind='stable')[:top]
+        keep &= np.isin(weights.row, most_common)
+    edges = pd.DataFrame({'source': left_labels[weights.row[keep]],
+                          'target': right_labels[weights.col[keep]],
+                          'weight': weights.data[keep]})
+    return edges.sort_values(['weight', 'source', 'target'], ascending=[False, True, True], ignore_index=True)
+
+
+# Graf networkx z tabulky hran sloupcu left a right. Uzly jsou dvojice (sloupec, hodnota) s popiskem
+# label, takze osoba, ktera je autorem i osobnosti, ma v grafu autor - osobnost dva ruzne uzly.
+# U dvou ruznych sloupcu je graf bipartitni (levy sloupec bipartite=1, pravy bipartite=0
+# jako v display_graph.ipynb)
+def build_graph(edges, left, right):
+    import networkx as nx
+
+    G = nx.Graph()
+    sources = [(left, value) for value in edges['source']]
+    targets = [(right, value) for value in edges['target']]
+    if left != right:
+        G.add_nodes_from(((node, {'label': node[1], 'bipartite': 1}) for node in dict.fromkeys(sources)))
+        G.add_nodes_from(((node, {'label': node[1], 'bipartite': 0}) for node in dict.fromkeys(targets)))
+    else:
+        G.add_nodes_from(((node, {'label': node[1]}) for node in dict.fromkeys(sources + targets)))
+    G.add_weighted_edges_from(zip(sources, targets, edges['weight'].astype(int)))
+    return G
+
+
+def graph_path(directory, name, left, right):
+    return os.path.join(directory, '{}_{}_{}.graphml'.format(name, left, right).replace(' ', '_'))
+
+
+if __name__ == '__main__':
+    import networkx as nx
+
+    parser = argparse.ArgumentParser(description="Build co-occurrence graphs (GraphML) from an extracted table.")
+    parser.add_argument('table', nargs='?', default='data/csv/out_ret.csv', help=".csv or .parquet table")
+    parser.add_argument('--output', default='data/graphs', help="output directory")
+    parser.add_argument('--threshold', type=int, default=1, help="minimal edge weight")
+    parser.add_argument('--top', type=int, default=None, help="keep only the most common values of the first column")
+    arguments = parser.parse_args()
+
+    df = load_ragged(arguments.table, list(set(chain.from_iterable(graphs))))
+    name = os.path.splitext(os.path.basename(arguments.table))[0]
+    os.makedirs(arguments.output, exist_ok=True)
+
+    for (left, right) in graphs:
+        edges = edge_table(df, left, right, arguments.threshold, arguments.top)
+        G = build_graph(edges, left, right)
+        path = graph_path(arguments.output, name, left, right)
+        nx.write_graphml(G, path)
+        print("Graph " + left + " - " + right + ": " + str(G.number_of_nodes()) + " nodes, "
+              + str(G.number_of_edges()) + " edges -> " + path)
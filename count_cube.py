@@ -0,0 +1,173 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from marc_table import missing_year, year_array
+from ragged import load_ragged, ragged
+
+# Predpocitane pocty hodnot po letech (database, rok, typ hodnoty, hodnota -> pocet).
+# Kostka se spocita jednou po extrakci a pak se z ni "nejcastejsi zanr v roce", podily
+# a klouzave prumery jen vyhledavaji, misto opakovaneho prochazeni tabulky (iterrows, Counter).
+# Hodnoty jsou v kostce ulozene jako cisla (kody), texty jsou jen jednou ve slovniku values.
+
+# Sloupce, ze kterych se pocty pocitaji
+facets = ['author', 'figures', 'description', 'genre', 'magazine name', 'place']
+
+# Vychozi tabulky (viz load_mrc_and_save_csv.py) a vystup
+tables = ['data/csv/ucla_B.csv', 'data/csv/ucla_ret.csv', 'data/csv/ucla_smz.csv',
+          'data/csv/ucla_int.csv', 'data/csv/ucla_cle.csv']
+cube_path = 'data/cube.npz'
+
+cube_dtype = np.dtype([('database', '<u2'),
+                       ('year', '<i2'),
+                       ('facet', '<u1'),
+                       ('value', '<i4'),
+                       ('count', '<i4')])
+
+# Pocet zaznamu v kazdem roce (pro podily)
+totals_dtype = np.dtype([('database', '<u2'),
+                         ('year', '<i2'),
+                         ('count', '<i4')])
+
+
+class CountCube:
+    def __init__(self, cube, totals, databases, facets, values):
+        self.cube = cube
+        self.totals_array = totals
+        self.databases = list(databases)
+        self.facets = list(facets)
+        self.values = np.asarray(values, dtype=str)
+
+    @classmethod
+    def load(cls, path=cube_path):
+        with np.load(path) as data:
+            return cls(data['cube'], data['totals'], data['databases'], data['facets'], data['values'])
+
+    def save(self, path=cube_path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(path, cube=self.cube, totals=self.totals_array,
+                            databases=np.array(self.databases, dtype=str), facets=np.array(self.facets, dtype=str),
+                            values=self.values)
+
+    def select(self, array, database):
+        if database is None:
+            return array
+        return array[array['database'] == self.databases.index(database)]
+
+    # Pocty (rok, kod hodnoty, pocet) pro jeden typ hodnoty. Bez database se databaze sectou
+    def frame(self, facet, database=None):
+        cube = self.select(self.cube, database)
+        cube = cube[cube['facet'] == self.facets.index(facet)]
+        df = pd.DataFrame({'year': cube['year'], 'value': cube['value'], 'count': cube['count']})
+        if database is None:
+            df = df.groupby(['year', 'value'], as_index=False, sort=False)['count'].sum()
+        return df
+
+    # Pocet zaznamu v jednotlivych letech
+    def totals(self, database=None):
+        totals = self.select(self.totals_array, database)
+        series = pd.Series(totals['count'], index=totals['year']).groupby(level=0).sum()
+        return series[series.index != missing_year]
+
+    # Nejcastejsi hodnoty za vsechny roky
+    def top_values(self, facet, n=10, database=None):
+        df = self.frame(facet, database)
+        counts = df.groupby('value', sort=False)['count'].sum()
+        counts = counts.iloc[np.argsort(-counts.to_numpy(), kind='stable')][:n]
+        return pd.Series(counts.to_numpy(), index=self.values[counts.index.to_numpy()], name=facet)
+
+    # Pocty vybranych hodnot po letech: radky jsou roky, sloupce hodnoty. Bez values vsechny hodnoty
+    def year_counts(self, facet, values=None, database=None):
+        df = self.frame(facet, database)
+        df = df[df['year'] != missing_year]
+        table = df.pivot_table(index='year', columns='value', values='count', aggfunc='sum', fill_value=0)
+        table.columns = self.values[table.columns.to_numpy()]
+        if values is not None:
+            table = table.reindex(columns=list(values), fill_value=0)
+        return table.sort_index()
+
+    # Nejcastejsi hodnota v kazdem roce (rok, hodnota, pocet). Pri shode vyhrava hodnota,
+    # ktera se v datech objevila driv, s ties=True se vrati vsechny hodnoty se stejnym poctem
+    def most_common(self, facet, database=None, ties=False):
+        df = self.frame(facet, database)
+        df = df[df['year'] != missing_year].sort_values(['year', 'count', 'value'], ascending=[True, False, True])
+        if ties:
+            df = df[df['count'] == df.groupby('year')['count'].transform('max')]
+        else:
+            df = df.drop_duplicates('year')
+        return pd.DataFrame({'year': df['year'].to_numpy(),
+                             'value': self.values[df['value'].to_numpy()],
+                             'count': df['count'].to_numpy()})
+
+    # Podil zaznamu s danou hodnotou na vsech zaznamech v roce
+    def proportions(self, facet, values, database=None):
+        counts = self.year_counts(facet, values, database)
+        return counts.div(self.totals(database).reindex(counts.index), axis=0)
+
+    def moving_average(self, facet, values, window=3, database=None):
+        return self.proportions(facet, values, database).rolling(window=window, min_periods=1).mean()
+
+
+# Spocita kostku z tabulek {nazev databaze: DataFrame se sloupci jako listy (viz load_table)
+# nebo RaggedTable (viz ragged.py)}. Pocty se spocitaji pres np.unique na klici (rok, kod hodnoty)
+def build_cube(tables, facets=facets):
+    codes = {}
+    cubes = []
+    totals = []
+    for (database, (name, df)) in enumerate(tables.items()):
+        years = year_array(df['year'])
+        (total_years, total_counts) = np.unique(years, return_counts=True)
+        total = np.empty(len(total_years), dtype=totals_dtype)
+        total['database'] = database
+        total['year'] = total_years
+        total['count'] = total_counts
+        totals.append(total)
+
+        for (facet, column) in enumerate(facets):
+            if column not in df.columns:
+                continue
+            values = ragged(df[column]).compact()
+            # Kody hodnot v tabulce prevedeme na kody spolecne pro vsechny tabulky
+            mapping = np.fromiter((codes.setdefault(label, len(codes)) for label in values.labels),
+                                  dtype=np.int64, count=len(values.labels))
+            # Rok v hornich 32 bitech, kod hodnoty v dolnich
+            keys = (np.repeat(years, values.lengths()).astype(np.int64) << 32) | mapping[values.codes]
+            (keys, counts) = np.unique(keys, return_counts=True)
+            cube = np.empty(len(keys), dtype=cube_dtype)
+            cube['database'] = database
+            cube['year'] = keys >> 32
+            cube['facet'] = facet
+            cube['value'] = keys & 0xffffffff
+            cube['count'] = counts
+            cubes.append(cube)
+
+    values = np.array(list(codes), dtype=str)
+    return CountCube(np.concatenate(cubes) if cubes else np.empty(0, dtype=cube_dtype),
+                     np.concatenate(totals) if totals else np.empty(0, dtype=totals_dtype),
+                     list(tables), facets, values)
+
+
+# Nazev databaze podle nazvu souboru, napr. data/csv/ucla_ret.csv -> ucla_ret
+def database_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pre-aggregate per-year value counts of extracted tables.")
+    parser.add_argument('tables', nargs='*', default=tables, help=".csv or .parquet tables")
+    parser.add_argument('--output', default=cube_path)
+    arguments = parser.parse_args()
+
+    data = {}
+    for path in arguments.tables:
+        df = load_ragged(path)
+        data[database_name(path)] = df
+        print("Loaded " + path + ": " + str(len(df)) + " records")
+    cube = build_cube(data)
+    cube.save(arguments.output)
+    print("Cube saved to " + arguments.output + ": " + str(len(cube.cube)) + " counts, "
+          + str(len(cube.values)) + " distinct values")
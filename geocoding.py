@@ -0,0 +1,163 @@
+import argparse
+import os
+import sqlite3
+import time
+from collections import Counter
+
+import pandas as pd
+
+from marc_fields import magazine_places
+from marc_table import load_table
+
+# Souradnice mist vydani. Vysledky hledani se ukladaji do SQLite (i mista, ktera se nenasla),
+# takze se zadne misto nehleda dvakrat. Cache je oddelena pro kazdou hledaci sluzbu: misto,
+# ktere neni v mistni tabulce (TableBackend), se pri pouziti OpenCage hleda znovu. Mista uz jsou upravena podle tabulky aliases
+# v marc_fields.py (preklepy, ceske a puvodni nazvy, vice mest v jednom udaji).
+# Vsechna nenalezena mista se posilaji hledaci sluzbe (backend) po davkach.
+
+cache_path = 'data/geocoding.sqlite'
+
+# Rucne zapsane souradnice (puvodni vystup z display_maps.ipynb)
+coordinates_path = 'data/coordinates.csv'
+
+# Pocet mist v jedne davce pro hledaci sluzbu
+batch_size = 50
+
+
+# Mista vydani z tabulky: ze sloupce place (viz marc_fields.py), u starsich tabulek ze sloupce magazine
+def table_places(df):
+    if 'place' in df.columns:
+        return [place for places in df['place'] for place in places]
+    return [place for magazines in df['magazine'] for magazine in magazines for place in magazine_places(magazine)]
+
+
+# Hledaci sluzba OpenCage (https://opencagedata.com/api). Klic se bere z promenne prostredi
+# OPENCAGE_API_KEY. Sluzba nema davkove dotazy, mista se hledaji postupne s pauzou delay
+class OpenCageBackend:
+    name = 'opencage'
+
+    def __init__(self, api_key=None, delay=1.0):
+        self.api_key = api_key or os.environ.get('OPENCAGE_API_KEY')
+        if not self.api_key:
+            raise ValueError("OpenCage needs an API key (OPENCAGE_API_KEY)")
+        self.delay = delay
+
+    def geocode(self, places):
+        import requests
+
+        coordinates = {}
+        for place in places:
+            response = requests.get('https://api.opencagedata.com/geocode/v1/json',
+                                    params={'q': place, 'key': self.api_key, 'limit': 1}, timeout=30)
+            if response.status_code != 200:
+                raise IOError("OpenCage error " + str(response.status_code) + " for " + place)
+            data = response.json()
+            if data['total_results'] > 0:
+                geometry = data['results'][0]['geometry']
+                coordinates[place] = (geometry['lat'], geometry['lng'])
+            else:
+                coordinates[place] = None
+            time.sleep(self.delay)
+        return coordinates
+
+
+# Mistni nahrada hledaci sluzby: souradnice z CSV tabulky (misto, sirka, delka)
+class TableBackend:
+    name = 'table'
+
+    def __init__(self, path=coordinates_path):
+        df = pd.read_csv(path)
+        self.coordinates = {row[0]: (float(row[1]), float(row[2])) for row in df.itertuples(index=False)}
+
+    def geocode(self, places):
+        return {place: self.coordinates.get(place) for place in places}
+
+
+backends = {'opencage': OpenCageBackend,
+            'table': TableBackend}
+
+
+class Geocoder:
+    def __init__(self, backend, path=cache_path, batch_size=batch_size):
+        self.backend = backend
+        self.batch_size = batch_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        # Nenalezena mista maji latitude a longitude NULL
+        self.connection.execute('CREATE TABLE IF NOT EXISTS lookups (backend TEXT, place TEXT, latitude REAL, '
+                                'longitude REAL, stamp REAL, PRIMARY KEY (backend, place))')
+        # Starsi cache mela jednu tabulku places pro vsechny sluzby, sluzba je ve sloupci source
+        if self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'places'").fetchone():
+            self.connection.execute('INSERT OR IGNORE INTO lookups SELECT source, place, latitude, longitude, stamp FROM places')
+            self.connection.execute('DROP TABLE places')
+        self.connection.commit()
+
+    def cached(self, places):
+        result = {}
+        for place in places:
+            row = self.connection.execute('SELECT latitude, longitude FROM lookups WHERE backend = ? AND place = ?',
+                                          (self.backend.name, place)).fetchone()
+            if row is not None:
+                result[place] = None if row[0] is None else (row[0], row[1])
+        return result
+
+    # Souradnice mist {misto: (sirka, delka) nebo None}. Mista, ktera v cache nejsou, se hledaji
+    # po davkach a kazda davka se hned ulozi. S retry=True se znovu hledaji i nenalezena mista
+    def resolve(self, places, retry=False):
+        places = list(dict.fromkeys(places))
+        result = self.cached(places)
+        missing = [place for place in places if place not in result or (retry and result[place] is None)]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            found = self.backend.geocode(batch)
+            for place in batch:
+                coordinates = found.get(place)
+                self.connection.execute('INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?, ?)',
+                                        (self.backend.name, place, None if coordinates is None else coordinates[0],
+                                         None if coordinates is None else coordinates[1], time.time()))
+                result[place] = coordinates
+            self.connection.commit()
+        return result
+
+    # Mista, ktera tato sluzba nenasla
+    def unresolved(self):
+        return [row[0] for row in self.connection.execute('SELECT place FROM lookups WHERE backend = ? AND latitude IS NULL '
+                                                          'ORDER BY place', (self.backend.name,))]
+
+    def close(self):
+        self.connection.close()
+
+
+# K tabulce mist (napr. pocty z count_cube.py) pripoji sloupce latitude a longitude
+def join_coordinates(df, geocoder, column='city'):
+    coordinates = geocoder.resolve(df[column])
+    df = df.copy()
+    df['latitude'] = [(coordinates[place] or (None, None))[0] for place in df[column]]
+    df['longitude'] = [(coordinates[place] or (None, None))[1] for place in df[column]]
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Geocode places of publication of an extracted table.")
+    parser.add_argument('table', nargs='?', default='data/csv/out_cle.csv', help=".csv or .parquet table")
+    parser.add_argument('--backend', choices=list(backends), default='table')
+    parser.add_argument('--cache', default=cache_path)
+    parser.add_argument('--retry', action='store_true', help="look up places that were not found before again")
+    parser.add_argument('--output', default=None, help="save the places with coordinates to a .csv file")
+    arguments = parser.parse_args()
+
+    geocoder = Geocoder(backends[arguments.backend](), arguments.cache)
+    places = table_places(load_table(arguments.table))
+    if arguments.retry:
+        geocoder.resolve(set(places), retry=True)
+    counts = Counter(places)
+    df = join_coordinates(pd.DataFrame({'city': list(counts), 'number of records': list(counts.values())}), geocoder)
+    print(df.to_string(index=False))
+    unresolved = geocoder.unresolved()
+    if unresolved:
+        print("Unresolved places: " + ", ".join(unresolved))
+    if arguments.output:
+        df.to_csv(arguments.output, encoding='utf8', index=False)
+    geocoder.close()
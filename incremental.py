@@ -0,0 +1,304 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+from pymarc import map_xml
+
+from compressed_io import base_path, blocks_path, input_position, is_compressed, open_input
+from instrumentation import Run, add_arguments, file_size, run_from_arguments
+from marc_sinks import MarcSink, open_sink, sink_type
+from mrc_index import index_dtype, open_index, index_path
+from mrc_mmap import MmapReader
+from split_databases import exports, select_databases, split
+
+# Prirustkove zpracovani noveho exportu z katalogu. Pro kazdy zaznam si v SQLite pamatujeme
+# id z pole 001, casove razitko z pole 005, hash zaznamu a databaze, do kterych patri.
+# Pri dalsim exportu se znovu smeruji a extrahuji jen nove, zmenene a smazane zaznamy
+# a vystupy jednotlivych databazi se jen upravi (nezmenene zaznamy se kopiruji po bajtech).
+#
+# Predpoklady:
+# - mezi vystupy je .mrc soubor, podle jeho indexu se upravuji ostatni vystupy
+# - radky v .csv/.parquet jsou ve stejnem poradi jako zaznamy v .mrc (tak je zapisuje split)
+# - pri zmene smerovaci tabulky je potreba znovu spustit cele split_databases.py
+# - zaznamy bez pole 001 nejde mezi exporty sparovat, proto se pri kazde aktualizaci
+#   z vystupu odstrani a zapisou znovu z noveho exportu
+#
+# Nove vystupy vsech databazi se nejdrive zapisi do docasnych souboru a puvodni se nahradi az potom,
+# co se podari zapsat vsechny. Stav v SQLite se ulozi az po nahrazeni, takze kdyz aktualizace
+# nekde spadne, vystupy i stav zustanou ve stavu po predchozi aktualizaci a jde ji spustit znovu.
+
+
+def state_path(export):
+    return 'data/state_{}.sqlite'.format(export)
+
+
+def open_state(path):
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE IF NOT EXISTS records '
+                       '(id TEXT PRIMARY KEY, stamp TEXT, hash TEXT, databases TEXT, generation INTEGER)')
+    connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+    return connection
+
+
+# Id z pole 001, None pokud pole chybi nebo je prazdne
+def record_id(r):
+    fields = r.get_fields('001')
+    return (fields[0].data.strip() or None) if fields else None
+
+
+def record_stamp(r):
+    fields = r.get_fields('005')
+    return fields[0].data.strip() if fields else None
+
+
+# Prvni spusteni: cely export rozdelime pomoci split a zaroven ulozime stav vsech zaznamu
+def initialize(file_path, routes, outputs, record_filter, connection, run):
+    stats = {'unchanged': 0, 'added': 0, 'changed': 0, 'deleted': 0, 'without id': 0}
+
+    def save_state(r, names):
+        if record_filter is not None and not record_filter(r):
+            return
+        key = record_id(r)
+        if key is None:
+            stats['without id'] += 1
+            return
+        digest = hashlib.sha1(MarcSink.serialize(r)).hexdigest()
+        connection.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, 1)',
+                           (key, record_stamp(r), digest, ','.join(names)))
+        stats['added'] += 1
+
+    split(file_path, routes, outputs, record_filter, observer=save_state, run=run)
+    connection.execute("INSERT OR REPLACE INTO meta VALUES ('generation', 1)")
+    return (stats, [name for (name, _, _) in routes])
+
+
+# Zjisti zmeny oproti poslednimu exportu. Vraci (nove zaznamy serializovane po databazich
+# a vystupech, mnozina id, ktera se maji z vystupu odstranit, statistiky).
+# Zaznamy bez id se odstrani vzdy (prazdne id '' v indexu) a pridaji se znovu.
+# Zaznam, u ktereho porovnani spadne na chybe, zustane ve vystupech v predchozi verzi
+def find_changes(file_path, routes, outputs, record_filter, connection, run):
+    (generation,) = connection.execute("SELECT COALESCE(MAX(value), 0) + 1 FROM meta WHERE key = 'generation'").fetchone()
+    types = [sink_type(output) for output in outputs]
+    pending = {name: [[] for _ in outputs] for (name, _, _) in routes}
+    dropped = {''}
+    stats = {'unchanged': 0, 'added': 0, 'changed': 0, 'deleted': 0, 'without id': 0}
+
+    # Prida serializovany zaznam na konec vystupu jeho databazi
+    def add_pending(r, names):
+        cache = {}
+        for t in types:
+            if names and t not in cache:
+                cache[t] = t.serialize(r)
+        for name in names:
+            for i, t in enumerate(types):
+                pending[name][i].append(cache[t])
+            run.count(name)
+
+    def check_record(r):
+        run.lap('parse')
+        run.record(position=input_position(xml_file))
+        key = None
+        try:
+            if record_filter is not None and not record_filter(r):
+                return
+            key = record_id(r)
+            if key is None:
+                (names, _) = select_databases(r, routes)
+                add_pending(r, names)
+                stats['without id'] += 1
+                return
+            stamp = record_stamp(r)
+            row = connection.execute('SELECT stamp, hash FROM records WHERE id = ?', (key,)).fetchone()
+
+            # Stejne razitko v poli 005 znamena, ze se zaznam nezmenil
+            if row is not None and stamp is not None and row[0] == stamp:
+                connection.execute('UPDATE records SET generation = ? WHERE id = ?', (generation, key))
+                stats['unchanged'] += 1
+                return
+
+            (names, _) = select_databases(r, routes)
+            data = MarcSink.serialize(r)
+            digest = hashlib.sha1(data).hexdigest()
+            if row is not None and row[1] == digest:
+                connection.execute('UPDATE records SET stamp = ?, generation = ? WHERE id = ?', (stamp, generation, key))
+                stats['unchanged'] += 1
+                return
+
+            # Starou verzi odstranime, az kdyz je nova serializovana. Id noveho zaznamu je v dropped
+            # take, aby ho opakovana aktualizace (napr. po chybe pri nahrazovani vystupu) nepridala dvakrat
+            add_pending(r, names)
+            dropped.add(key)
+            if row is not None:
+                stats['changed'] += 1
+            else:
+                stats['added'] += 1
+            connection.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)',
+                               (key, stamp, digest, ','.join(names), generation))
+        except Exception as error:
+            run.error(error, r)
+            # Zaznam je v exportu dal, nesmi se smazat jako zaznam, ktery v exportu chybi
+            if key is not None:
+                connection.execute('UPDATE records SET generation = ? WHERE id = ?', (generation, key))
+        finally:
+            run.lap('compare')
+
+    with open_input(file_path) as xml_file:
+        map_xml(check_record, xml_file)
+
+    # Zaznamy, ktere v novem exportu nejsou, byly smazany
+    for (key,) in connection.execute('SELECT id FROM records WHERE generation < ?', (generation,)).fetchall():
+        dropped.add(key)
+        stats['deleted'] += 1
+    connection.execute('DELETE FROM records WHERE generation < ?', (generation,))
+    connection.execute("INSERT OR REPLACE INTO meta VALUES ('generation', ?)", (generation,))
+    return (pending, dropped, stats)
+
+
+# Docasna cesta se stejnou priponou (aby open_sink poznal format), napr. ucla_B.mrc.gz -> ucla_B.tmp.mrc.gz
+def temporary_path(path):
+    name = os.path.splitext(base_path(path))[0]
+    return name + '.tmp' + path[len(name):]
+
+
+# Smaze docasne soubory (pri chybe, puvodni vystupy zustanou beze zmeny)
+def remove_temporary(replacements):
+    for (temporary, _) in replacements:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+# Zapise upravene vystupy jedne databaze do docasnych souboru: bez zaznamu s id v dropped
+# a s novymi zaznamy na konci. Vraci [(docasny soubor, puvodni soubor), ...], prazdny list,
+# pokud se databaze nezmenila. Puvodni soubory se nahradi az v replace_outputs
+def patch_database(name, outputs, pending, dropped):
+    mrc_outputs = [output for output in outputs if base_path(output).endswith('.mrc')]
+    if not mrc_outputs:
+        raise ValueError("Incremental update needs a .mrc output")
+    mrc_path = mrc_outputs[0].format(name)
+
+    if os.path.exists(mrc_path):
+        index = np.asarray(open_index(mrc_path))
+    else:
+        index = np.empty(0, dtype=index_dtype())
+    # Index je serazeny podle id, radky ve vystupech jsou v poradi zaznamu v souboru
+    index = index[np.argsort(index['offset'], kind='stable')]
+    # Sirka id se bere z dat, aby se dlouha id neorizla
+    dropped_ids = np.array([key.encode('utf8') for key in dropped], dtype=bytes)
+    keep = ~np.isin(index['id'], dropped_ids)
+
+    if keep.all() and not any(pending):
+        return []
+
+    mrc_position = outputs.index(mrc_outputs[0])
+    temporary = temporary_path(mrc_path)
+    replacements = [(temporary, mrc_path), (index_path(temporary), index_path(mrc_path))]
+    if is_compressed(mrc_path):
+        replacements.append((blocks_path(temporary), blocks_path(mrc_path)))
+    try:
+        sink = open_sink(temporary)
+        if len(index) > 0:
+            with MmapReader(mrc_path) as reader:
+                for offset in index['offset'][keep]:
+                    sink.write_serialized(reader.record_at(int(offset)).as_bytes())
+        for data in pending[mrc_position]:
+            sink.write_serialized(data)
+        sink.close()
+
+        for i, output in enumerate(outputs):
+            if i != mrc_position:
+                path = output.format(name)
+                replacements.append((temporary_path(path), path))
+                patch_output(path, temporary_path(path), mrc_path, temporary, keep, pending[i])
+    except Exception:
+        remove_temporary(replacements)
+        raise
+    return replacements
+
+
+# Zapise upraveny vystup path (jiny nez .mrc) do docasneho souboru output
+def patch_output(path, output, mrc_path, temporary, keep, pending):
+    extension = os.path.splitext(base_path(path))[1].lower()
+    if extension == '.csv' and os.path.exists(path):
+        df = pd.read_csv(path, dtype='str', keep_default_na=False)
+        if len(df) != len(keep):
+            raise ValueError(path + " is out of sync with " + mrc_path + ", run a full split")
+        new = pd.DataFrame(pending, columns=df.columns)
+        pd.concat([df[keep], new]).to_csv(output, encoding='utf8', index=False)
+    elif extension == '.parquet' and os.path.exists(path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        from marc_table import to_arrow
+
+        table = pq.read_table(path)
+        if table.num_rows != len(keep):
+            raise ValueError(path + " is out of sync with " + mrc_path + ", run a full split")
+        table = table.filter(pa.array(keep))
+        new = to_arrow(pd.DataFrame(pending, columns=table.column_names))
+        pq.write_table(pa.concat_tables([table, new.cast(table.schema)]), output)
+    else:
+        # Ostatni formaty (.mrk, .xml) zapiseme znovu z upraveneho .mrc
+        output_sink = open_sink(output)
+        with MmapReader(temporary) as reader:
+            for view in reader:
+                output_sink.write(view.to_record())
+        output_sink.close()
+
+
+# Nahradi puvodni vystupy docasnymi (az kdyz se podarilo zapsat vystupy vsech databazi)
+def replace_outputs(replacements):
+    for (temporary, path) in replacements:
+        os.replace(temporary, path)
+
+
+# Prirustkova aktualizace jednoho exportu. Pri prvnim spusteni (prazdny stav) se export rozdeli cely.
+# Prubeh a chyby sleduje run (viz instrumentation.py), bez nej se vytvori vychozi
+def update(file_path, routes, outputs, record_filter=None, path=None, run=None):
+    own_run = run is None
+    if own_run:
+        run = Run('update ' + file_path, file_size(file_path))
+    connection = open_state(path)
+    try:
+        if connection.execute('SELECT COUNT(*) FROM records').fetchone()[0] == 0:
+            (stats, patched) = initialize(file_path, routes, outputs, record_filter, connection, run)
+        else:
+            (pending, dropped, stats) = find_changes(file_path, routes, outputs, record_filter, connection, run)
+            replacements = {}
+            try:
+                for (name, _, _) in routes:
+                    replacements[name] = patch_database(name, outputs, pending[name], dropped)
+            except Exception:
+                for files in replacements.values():
+                    remove_temporary(files)
+                raise
+            patched = [name for (name, files) in replacements.items() if files]
+            for name in patched:
+                replace_outputs(replacements[name])
+            run.lap('patch')
+        # Stav ulozime, az kdyz jsou vystupy upravene
+        connection.commit()
+    finally:
+        connection.close()
+        if own_run:
+            run.close()
+    return (stats, patched)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Update split databases from a new catalogue export.")
+    parser.add_argument('exports', nargs='*', help="exports to update: " + ", ".join(exports) + " (default: all)")
+    add_arguments(parser)
+    arguments = parser.parse_args()
+    for export in arguments.exports:
+        if export not in exports:
+            parser.error("unknown export: " + export)
+
+    for export in arguments.exports or list(exports):
+        (file_path, routes, outputs, record_filter) = exports[export]
+        with run_from_arguments('update ' + export, arguments, file_size(file_path)) as run:
+            (stats, patched) = update(file_path, routes, outputs, record_filter, state_path(export), run)
+        print("Export " + export + ": " + ", ".join(key + " " + str(value) for key, value in stats.items()))
+        print("Patched databases: " + (", ".join(patched) or "none"))
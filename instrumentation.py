@@ -0,0 +1,234 @@
+import cProfile
+import json
+import os
+import pstats
+import signal
+import sys
+import time
+import traceback
+from collections import Counter
+
+# Sledovani dlouhych behu: pocet zpracovanych zaznamu a rychlost, odhad zbyvajiciho casu podle
+# pozice ve vstupnim souboru, pocty zaznamu v jednotlivych databazich, cas straveny ctenim (parse)
+# a zapisem (write) a chyby. Kazda chyba se zapise jako jeden radek JSON (JSONL) i s id zaznamu
+# z pole 001 a celym tracebackem, takze se da dohledat, ktery zaznam chybu zpusobil.
+# Volitelne se beh profiluje (cProfile nebo vzorkovani zasobniku) a nejpomalejsi mista se ulozi.
+
+error_log_path = 'data/logs/errors.jsonl'
+
+# Jak casto (v sekundach) se vypisuje prubeh
+progress_interval = 10.0
+
+# Pocet radku ve vypisu profilu
+profile_lines = 25
+
+
+# Id zaznamu z pole 001 (nebo None)
+def record_id(r):
+    try:
+        fields = r.get_fields('001')
+    except Exception:
+        return None
+    return fields[0].data if fields else None
+
+
+# Chyba jako slovnik pro JSONL: typ, zprava, traceback, id a navesti zaznamu a dalsi udaje
+def error_entry(error, r=None, **context):
+    entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+             'type': type(error).__name__,
+             'message': str(error),
+             'id': record_id(r) if r is not None else None,
+             'leader': str(getattr(r, 'leader', None)) if r is not None else None,
+             'traceback': ''.join(traceback.format_exception(type(error), error, error.__traceback__))}
+    entry.update(context)
+    return entry
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return '{}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+# Vzorkovani zasobniku: kazdych interval sekund (casu procesoru) se zapamatuje zasobnik hlavniho
+# vlakna. Vysledek je ve formatu "collapsed stacks" (funkce;funkce;... pocet), ze ktereho
+# se da vykreslit flame graph. Funguje jen na systemech se signalem SIGPROF (Linux, macOS)
+class Sampler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf8') as file:
+            for (stack, count) in self.stacks.most_common():
+                file.write(stack + ' ' + str(count) + '\n')
+
+    # Funkce, ve kterych proces travi nejvic casu (na vrcholu zasobniku)
+    def summary(self, lines=profile_lines):
+        top = Counter()
+        for (stack, count) in self.stacks.items():
+            top[stack.rsplit(';', 1)[-1]] += count
+        total = sum(top.values()) or 1
+        return '\n'.join('{:6.1%} {}'.format(count / total, name) for (name, count) in top.most_common(lines))
+
+
+class Profiler:
+    def __init__(self, kind, path):
+        self.kind = kind
+        self.path = path
+        self.profiler = cProfile.Profile() if kind == 'cprofile' else Sampler()
+
+    def start(self):
+        if self.kind == 'cprofile':
+            self.profiler.enable()
+        else:
+            self.profiler.start()
+
+    def stop(self, stream):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.kind == 'cprofile':
+            self.profiler.disable()
+            self.profiler.dump_stats(self.path)
+            pstats.Stats(self.profiler, stream=stream).sort_stats('cumulative').print_stats(profile_lines)
+        else:
+            self.profiler.stop()
+            self.profiler.save(self.path)
+            print(self.profiler.summary(), file=stream)
+        print("Profile saved to " + self.path, file=stream)
+
+
+# Jeden sledovany beh (napr. deleni jednoho exportu). Prubeh se vypisuje do stream (stderr),
+# aby nemichal s vystupem skriptu. size je velikost vstupniho souboru v bajtech (pro odhad casu)
+class Run:
+    def __init__(self, name, size=None, errors_path=error_log_path, interval=progress_interval,
+                 profile=None, profile_path=None, stream=None):
+        self.name = name
+        self.size = size
+        self.errors_path = errors_path
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.records = 0
+        self.position = None
+        self.errors = 0
+        self.counters = Counter()
+        self.times = Counter()
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.reported = self.start
+        self.error_file = None
+        self.profiler = None
+        if profile is not None:
+            self.profiler = Profiler(profile, profile_path or os.path.join(
+                'data/logs', name.replace(' ', '_').replace('/', '_') + ('.prof' if profile == 'cprofile' else '.stacks')))
+            self.profiler.start()
+
+    # Cas od posledniho volani lap (nebo od zacatku) se pricte ke kroku stage (napr. parse, write)
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.times[stage] += now - self.last
+        self.last = now
+
+    # Zapocita zpracovane zaznamy a pozici ve vstupnim souboru. Obcas vypise prubeh
+    def record(self, count=1, position=None):
+        self.records += count
+        if position is not None:
+            self.position = position
+        if self.interval is not None and time.perf_counter() - self.reported >= self.interval:
+            self.report()
+
+    # Pocty zaznamu podle klice (napr. databaze, do ktere se zaznam zapsal)
+    def count(self, key, count=1):
+        self.counters[key] += count
+
+    def error(self, error, r=None, **context):
+        self.log(error_entry(error, r, **context))
+
+    # Zapise chybu (slovnik z error_entry, napr. z jineho procesu) do JSONL a kratce ji vypise
+    def log(self, entry):
+        self.errors += 1
+        if self.errors_path is not None:
+            if self.error_file is None:
+                directory = os.path.dirname(self.errors_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self.error_file = open(self.errors_path, 'a', encoding='utf8')
+            entry = dict(entry, run=self.name)
+            self.error_file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.error_file.flush()
+        print("Exception: " + entry['type'] + " in record " + str(entry.get('id')) + ": " + entry['message'],
+              file=self.stream)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def report(self, final=False):
+        self.reported = time.perf_counter()
+        elapsed = self.elapsed()
+        parts = [self.name + ": " + str(self.records) + " records",
+                 "{:.0f} records/s".format(self.records / elapsed if elapsed > 0 else 0),
+                 "elapsed " + format_duration(elapsed)]
+        if not final and self.size and self.position:
+            done = min(self.position / self.size, 1.0)
+            parts.append("{:.1%} of input".format(done))
+            if done > 0:
+                parts.append("ETA " + format_duration(elapsed * (1 - done) / done))
+        if self.times:
+            parts.append(", ".join("{} {:.1f} s".format(stage, seconds) for (stage, seconds) in self.times.items()))
+        if self.counters:
+            parts.append(", ".join(str(key) + " " + str(value) for (key, value) in self.counters.items()))
+        if self.errors:
+            parts.append(str(self.errors) + " errors" + (" (" + self.errors_path + ")" if self.errors_path else ""))
+        print("; ".join(parts), file=self.stream)
+
+    def close(self):
+        if self.profiler is not None:
+            self.profiler.stop(self.stream)
+            self.profiler = None
+        if self.error_file is not None:
+            self.error_file.close()
+            self.error_file = None
+        self.report(final=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+# Velikost souboru pro odhad zbyvajiciho casu (None, pokud soubor neexistuje)
+def file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else None
+
+
+# Spolecne prepinace pro skripty s argparse
+def add_arguments(parser):
+    parser.add_argument('--progress', type=float, default=progress_interval, metavar='SECONDS',
+                        help="report progress every SECONDS (0 = only at the end)")
+    parser.add_argument('--errors', default=error_log_path, help="append errors as JSON lines to this file")
+    parser.add_argument('--profile', choices=['cprofile', 'sample'], default=None,
+                        help="profile the run with cProfile or by sampling stacks")
+    parser.add_argument('--profile-output', default=None, help="where to save the profile")
+
+
+# Run podle prepinacu z add_arguments
+def run_from_arguments(name, arguments, size=None):
+    return Run(name, size, arguments.errors, arguments.progress or None,
+               arguments.profile, arguments.profile_output)
@@ -0,0 +1,194 @@
+import argparse
+import os
+from functools import reduce
+
+import numpy as np
+
+from marc_fields import field_list, table_columns
+from marc_table import TableWriter, as_list, missing_year, year_array, year_column
+from record_cache import extracted_batches
+from vocabulary import ColumnBuilder, EncodedTable, Vocabulary
+
+# Invertovany index: pro kazdou hodnotu (jmeno, autoritni kod, zanr, tema, casopis) serazeny
+# seznam cisel zaznamu (postings), kde se hodnota objevuje. Vyber zaznamu o jedne osobe je pak jen
+# vyhledani seznamu, kombinace podminek je prunik (AND) nebo sjednoceni (OR) seznamu.
+# Index se sestavuje z davek extrakce (viz record_cache.py), ze kterych se zaroven zapisuje tabulka,
+# takze cislo zaznamu je radek v tabulce, i kdyz extrakce nektery zaznam preskoci (napr. po chybe).
+# Index se uklada vedle .mrc jako <nazev>.inv.npz
+
+# Sloupce tabulky v indexu: (sloupec, sloupec s autoritnimi kody nebo None)
+index_columns = [('author', 'author code'),
+                 ('figures', 'figures code'),
+                 ('description', None),
+                 ('genre', None),
+                 ('magazine', None)]
+
+
+def inverted_index_path(mrc_path):
+    return os.path.splitext(mrc_path)[0] + '.inv.npz'
+
+
+# Zakodovana tabulka (viz vocabulary.py) se uklada vedle indexu jako <nazev>.enc.npz
+def encoded_table_path(mrc_path):
+    return os.path.splitext(mrc_path)[0] + '.enc.npz'
+
+
+# Prunik serazenych seznamu
+def intersect(*postings):
+    return reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), postings)
+
+
+# Sjednoceni serazenych seznamu
+def union(*postings):
+    return reduce(np.union1d, postings, np.empty(0, dtype=np.int32))
+
+
+class InvertedIndex:
+    def __init__(self, year, year_order, facets):
+        self.year = year
+        # Cisla zaznamu serazena podle roku (pro vyber rozsahu let)
+        self.year_order = year_order
+        # {facet: (slovnik, postings, starts)}, seznam hodnoty i je postings[starts[i]:starts[i + 1]]
+        self.facets = facets
+
+    def __len__(self):
+        return len(self.year)
+
+    @classmethod
+    def build(cls, table):
+        facets = {}
+        for (facet, column) in table.columns.items():
+            # Dvojice (id hodnoty, cislo zaznamu) bez opakovani, serazene podle id a pak zaznamu
+            keys = np.unique((column.ids.astype(np.int64) << 32) | column.rows())
+            postings = (keys & 0xffffffff).astype(np.int32)
+            counts = np.bincount(keys >> 32, minlength=len(column.vocabulary))
+            starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+            facets[facet] = (column.vocabulary, postings, starts)
+        year_order = np.argsort(table.year, kind='stable').astype(np.int32)
+        return cls(table.year, year_order, facets)
+
+    def save(self, path):
+        arrays = {'year': self.year, 'year_order': self.year_order}
+        for (facet, (vocabulary, postings, starts)) in self.facets.items():
+            arrays[facet + '.keys'] = np.array(vocabulary.keys, dtype=str)
+            arrays[facet + '.labels'] = np.array(vocabulary.labels, dtype=str)
+            arrays[facet + '.postings'] = postings
+            arrays[facet + '.starts'] = starts
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            names = [name[:-len('.postings')] for name in data.files if name.endswith('.postings')]
+            facets = {}
+            for facet in names:
+                vocabulary = Vocabulary(data[facet + '.keys'].tolist(), data[facet + '.labels'].tolist())
+                facets[facet] = (vocabulary, data[facet + '.postings'], data[facet + '.starts'])
+            return cls(data['year'], data['year_order'], facets)
+
+    # Seznam zaznamu s hodnotou (jmeno, autoritni kod nebo id ze slovniku). Jmeno muze mit
+    # ve slovniku vice id (s autoritnim kodem i bez nej), pak je to sjednoceni jejich seznamu
+    def postings(self, facet, value):
+        (vocabulary, postings, starts) = self.facets[facet]
+        ids = [value] if isinstance(value, (int, np.integer)) else vocabulary.lookup(value)
+        return union(*[postings[starts[i]:starts[i + 1]] for i in ids])
+
+    # Zaznamy z let first az last (vcetne). Zaznamy bez roku se nevybiraji
+    def years(self, first=None, last=None):
+        years = self.year[self.year_order]
+        start = np.searchsorted(years, missing_year + 1 if first is None else first, side='left')
+        end = len(years) if last is None else np.searchsorted(years, last, side='right')
+        return np.sort(self.year_order[start:end])
+
+    # Vyber zaznamu. terms je slovnik {facet: hodnota nebo list hodnot}, hodnoty v listu se
+    # spojuji pres OR, jednotlive facety pres AND (nebo pres OR, pokud je combine='or').
+    # years je rozsah let (od, do) vcetne, ktery se vzdy pridava pres AND
+    def select(self, terms=None, years=None, combine='and'):
+        postings = []
+        for (facet, values) in (terms or {}).items():
+            if isinstance(values, (list, tuple, set)):
+                postings.append(union(*[self.postings(facet, value) for value in values]))
+            else:
+                postings.append(self.postings(facet, values))
+        if postings:
+            result = intersect(*postings) if combine == 'and' else union(*postings)
+        else:
+            result = np.arange(len(self), dtype=np.int32)
+        if years is not None:
+            result = intersect(result, self.years(*years))
+        return result
+
+
+# Postupne sestavuje zakodovanou tabulku (viz vocabulary.py) z davek extrakce, radek po radku
+class EncodedTableBuilder:
+    def __init__(self, columns=index_columns):
+        self.columns = columns
+        self.builders = {column: ColumnBuilder() for (column, _) in columns}
+        self.years = []
+
+    def add_batch(self, batch):
+        self.years.append(year_array(batch[year_column]))
+        for (column, code_column) in self.columns:
+            builder = self.builders[column]
+            codes = batch[code_column] if code_column is not None else None
+            for (i, cell) in enumerate(batch[column]):
+                names = as_list(cell)
+                row_codes = as_list(codes[i]) if codes is not None else []
+                # Kod patri ke jmenu, jen pokud ma kazde jmeno zaznamu svuj kod
+                if len(row_codes) != len(names):
+                    row_codes = [None] * len(names)
+                builder.add([(name, code or None) for (name, code) in zip(names, row_codes)])
+
+    def to_table(self):
+        year = np.concatenate(self.years) if self.years else np.empty(0, dtype=np.int16)
+        return EncodedTable(year, {column: builder.to_column() for (column, builder) in self.builders.items()})
+
+
+# Index pro .mrc soubor. Pokud chybi nebo je starsi nez .mrc, sestavi se znovu
+def open_inverted_index(mrc_path):
+    path = inverted_index_path(mrc_path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(mrc_path):
+        return InvertedIndex.load(path)
+    return build_inverted_index(mrc_path)
+
+
+# Invertovany index z extrakce .mrc souboru. Se zadanym table_path se ze stejnych davek zapise
+# i tabulka (jako save_csv.py), s encoded_path i zakodovana tabulka (viz vocabulary.py)
+def build_inverted_index(mrc_path, table_path=None, encoded_path=None, batch_size=50000):
+    columns = table_columns(field_list)
+    builder = EncodedTableBuilder([(column, code) for (column, code) in index_columns if column in columns])
+    writer = TableWriter(table_path, columns, batch_size) if table_path is not None else None
+    for batch in extracted_batches(mrc_path, field_list, batch_size):
+        builder.add_batch(batch)
+        if writer is not None:
+            writer.write_batch(batch)
+    if writer is not None:
+        writer.close()
+    table = builder.to_table()
+    if encoded_path is not None:
+        table.save(encoded_path)
+    index = InvertedIndex.build(table)
+    index.save(inverted_index_path(mrc_path))
+    return index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build an inverted index for a .mrc file or query it.")
+    parser.add_argument('mrc', help="input .mrc file")
+    parser.add_argument('--term', nargs=2, action='append', metavar=('FACET', 'VALUE'), default=[],
+                        help="facet and value (name or authority code), can be repeated")
+    parser.add_argument('--years', nargs=2, type=int, metavar=('FIRST', 'LAST'))
+    parser.add_argument('--any', action='store_true', help="combine terms with OR instead of AND")
+    arguments = parser.parse_args()
+
+    if not arguments.term and arguments.years is None:
+        index = build_inverted_index(arguments.mrc)
+        print("Inverted index for " + str(len(index)) + " records -> " + inverted_index_path(arguments.mrc))
+    else:
+        index = open_inverted_index(arguments.mrc)
+        terms = {}
+        for (facet, value) in arguments.term:
+            terms.setdefault(facet, []).append(value)
+        result = index.select(terms, arguments.years, 'or' if arguments.any else 'and')
+        print("Records: " + str(len(result)))
+        print(' '.join(str(position) for position in result))
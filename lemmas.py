@@ -0,0 +1,146 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from multiprocessing import Pool
+
+from marc_table import as_list, load_table
+
+# Lemmatizace textu (nazvy, komentare) pres spacy_udpipe. Texty se zpracovavaji po davkach
+# pres nlp.pipe a davky se rozdeli mezi procesy. Vysledek pro kazdy text (seznam dvojic
+# (lemma, slovni druh)) se ulozi do SQLite pod hashem textu, takze se zadny text nelemmatizuje
+# dvakrat. Stop slova a vyber slovnich druhu (napr. jen ADJ nebo NOUN) se pouziji az na
+# ulozene vysledky, jejich zmena tedy nic nestoji.
+
+cache_path = 'data/lemmas.sqlite'
+
+# Pocet textu v jedne davce pro nlp.pipe
+batch_size = 256
+
+# Model nacteny v procesu (viz load_model)
+nlp = None
+
+
+def load_model(language):
+    global nlp
+    import spacy_udpipe
+
+    nlp = spacy_udpipe.load(language)
+
+
+# Lemmata a slovni druhy davky textu. Vola se v procesu s nactenym modelem
+def analyze_batch(texts):
+    return [[(token.lemma_, token.pos_) for token in doc] for doc in nlp.pipe(texts, batch_size=len(texts))]
+
+
+def text_key(language, text):
+    return hashlib.sha1((language + '\0' + text).encode('utf8')).hexdigest()
+
+
+# Nazev bez udaje o odpovednosti (za ' /') nebo bez podnazvu (za ' :')
+def clean_title(title):
+    for separator in (' /', ' :'):
+        if title.rfind(separator) != -1:
+            return title[:title.rfind(separator)]
+    return title
+
+
+# Lemmata, ktera nejsou ve stop slovech a (pokud je zadano pos) maji jeden z vybranych slovnich druhu
+def filter_lemmas(tokens, stop=(), pos=None):
+    return [lemma for (lemma, token_pos) in tokens if lemma not in stop and (pos is None or token_pos in pos)]
+
+
+class Lemmatizer:
+    def __init__(self, language='cs', path=cache_path, processes=None, batch_size=batch_size):
+        self.language = language
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS lemmas (key TEXT PRIMARY KEY, tokens TEXT)')
+        self.connection.commit()
+
+    # Ulozene vysledky {text: [(lemma, slovni druh), ...]}
+    def cached(self, texts):
+        result = {}
+        for text in texts:
+            row = self.connection.execute('SELECT tokens FROM lemmas WHERE key = ?',
+                                          (text_key(self.language, text),)).fetchone()
+            if row is not None:
+                result[text] = [tuple(token) for token in json.loads(row[0])]
+        return result
+
+    def store(self, texts, analyzed):
+        self.connection.executemany('INSERT OR REPLACE INTO lemmas VALUES (?, ?)',
+                                    [(text_key(self.language, text), json.dumps(tokens, ensure_ascii=False))
+                                     for (text, tokens) in zip(texts, analyzed)])
+        self.connection.commit()
+
+    # Lemmata a slovni druhy textu {text: [(lemma, slovni druh), ...]}. Texty, ktere v cache nejsou,
+    # se lemmatizuji po davkach, kazda davka se hned ulozi. Pri vice davkach se pouzije vice procesu
+    def analyze(self, texts):
+        texts = list(dict.fromkeys(texts))
+        result = self.cached(texts)
+        missing = [text for text in texts if text not in result]
+        if not missing:
+            return result
+
+        import spacy_udpipe
+
+        # Model se stahne jen jednou (v hlavnim procesu), procesy ho pak jen nacitaji
+        spacy_udpipe.download(self.language)
+        batches = [missing[start:start + self.batch_size] for start in range(0, len(missing), self.batch_size)]
+        processes = min(self.processes, len(batches))
+        if processes == 1:
+            load_model(self.language)
+            analyzed_batches = map(analyze_batch, batches)
+            pool = None
+        else:
+            pool = Pool(processes, initializer=load_model, initargs=(self.language,))
+            analyzed_batches = pool.imap(analyze_batch, batches)
+        try:
+            for (batch, analyzed) in zip(batches, analyzed_batches):
+                self.store(batch, analyzed)
+                result.update(zip(batch, [[tuple(token) for token in tokens] for tokens in analyzed]))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return result
+
+    # Lemmata pro kazdy text (ve stejnem poradi jako texts) po odfiltrovani stop slov a slovnich druhu
+    def lemmas(self, texts, stop=(), pos=None):
+        texts = list(texts)
+        analyzed = self.analyze(texts)
+        return [filter_lemmas(analyzed[text], stop, pos) for text in texts]
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM lemmas').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Lemmatize a text column of an extracted table into the lemma cache.")
+    parser.add_argument('table', nargs='?', default='data/csv/out_B.csv', help=".csv or .parquet table")
+    parser.add_argument('--column', default='title')
+    parser.add_argument('--language', default='cs')
+    parser.add_argument('--cache', default=cache_path)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=batch_size)
+    arguments = parser.parse_args()
+
+    df = load_table(arguments.table, [arguments.column])
+    texts = [text for values in df[arguments.column] for text in as_list(values)]
+    if arguments.column == 'title':
+        texts = [clean_title(text) for text in texts]
+    lemmatizer = Lemmatizer(arguments.language, arguments.cache, arguments.processes, arguments.batch_size)
+    before = len(lemmatizer)
+    lemmatizer.analyze(texts)
+    print("Texts: " + str(len(set(texts))) + ", newly lemmatized: " + str(len(lemmatizer) - before)
+          + ", cached: " + str(len(lemmatizer)))
+    lemmatizer.close()
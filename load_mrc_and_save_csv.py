@@ -1,5 +1,9 @@
 from pymarc import MARCReader
-import pandas as pd
+
+from compressed_io import input_position, open_input
+from instrumentation import Run, file_size
+from marc_table import TableWriter
+from record_cache import RecordCache
 
 
 in_B = 'data/ucla/ucla_B.mrc'
@@ -9,12 +13,18 @@ in_int = 'data/ucla/ucla_int.mrc'
 in_cle = 'data/ucla/ucla_cle.mrc'
 in_trl = 'data/ucla/ucla_trl.mrc'
 
-out_B = 'data/csv/ucla_B.csv'
-out_ret = 'data/csv/ucla_ret.csv'
-out_smz = 'data/csv/ucla_smz.csv'
-out_int = 'data/csv/ucla_int.csv'
-out_cle = 'data/csv/ucla_cle.csv'
-out_trl = 'data/csv/ucla_trl.csv'
+# Format vystupu: 'csv' nebo 'parquet'
+output_format = 'csv'
+
+out_B = 'data/csv/ucla_B.' + output_format
+out_ret = 'data/csv/ucla_ret.' + output_format
+out_smz = 'data/csv/ucla_smz.' + output_format
+out_int = 'data/csv/ucla_int.' + output_format
+out_cle = 'data/csv/ucla_cle.' + output_format
+out_trl = 'data/csv/ucla_trl.' + output_format
+
+# Pocet zaznamu, ktere drzime v pameti, nez je zapiseme do souboru
+batch_size = 50000
 
 databases_B = ['B12', 'B45', 'B97', 'B70', 'B80']  
 database_ret = 'RET'
@@ -24,7 +34,7 @@ database_cle = 'CLE'
 database_trl = 'TRL'
 
 
-def save_to_dict(r, database, dict):
+def save_to_dict(r, database, dict, run):
     if not r is None:
         for field in r.get_fields('964'):
             if field['a'] in database:
@@ -72,94 +82,49 @@ def save_to_dict(r, database, dict):
                     dict['genre'].append(genre)     
         
                 except Exception as error:
-                    print("Exception: " + type(error).__name__)  
-                    print("964 Field: " + str(r.get_fields('964')))  
-                    print("LDR: " + str(r.leader))   
+                    run.error(error, r, fields_964=str(r.get_fields('964')))
     return dict            
 
 
 
-with open(in_int, 'rb') as data:
-    reader = MARCReader(data)
-    dict = {'title': [], 
-                    'author': [],
-                    'author code': [],
-                    'year': [],
-                    'figures' : [],
-                    'description' : [],
-                    'genre' : [] } 
-    for record in reader:
-        dict = save_to_dict(record, database_int, dict)
-    df = pd.DataFrame.from_dict(dict)
-    df['figures'] = df['figures'].apply(lambda x: ';'.join(x))
-    df['description'] = df['description'].apply(lambda x: ';'.join(x))
-    df['genre'] = df['genre'].apply(lambda x: ';'.join(x))
-    df.to_csv(out_int, encoding = 'utf8', sep = ",")    
-
-with open(in_B, 'rb') as data:
-    reader = MARCReader(data)
-    dict = {'title': [], 
-                    'author': [],
-                    'author code': [],
-                    'year': [],
-                    'figures' : [],
-                    'description' : [],
-                    'genre' : [] } 
-    for record in reader:
-        dict = save_to_dict(record, databases_B, dict)
-    df = pd.DataFrame.from_dict(dict)
-    df['figures'] = df['figures'].apply(lambda x: ';'.join(x))
-    df['description'] = df['description'].apply(lambda x: ';'.join(x))
-    df['genre'] = df['genre'].apply(lambda x: ';'.join(x))
-    df.to_csv(out_B, encoding = 'utf8', sep = ",")            
-
-with open(in_cle, 'rb') as data:
-    reader = MARCReader(data)
-    dict = {'title': [], 
-                    'author': [],
-                    'author code': [],
-                    'year': [],
-                    'figures' : [],
-                    'description' : [],
-                    'genre' : [] } 
-    for record in reader:
-        dict = save_to_dict(record, database_cle, dict)
-    df = pd.DataFrame.from_dict(dict)
-    df['figures'] = df['figures'].apply(lambda x: ';'.join(x))
-    df['description'] = df['description'].apply(lambda x: ';'.join(x))
-    df['genre'] = df['genre'].apply(lambda x: ';'.join(x))
-    df.to_csv(out_cle, encoding = 'utf8', sep = ",")          
-    
-with open(in_ret, 'rb') as data:
-    reader = MARCReader(data)
-    dict = {'title': [], 
-                    'author': [],
-                    'author code': [],
-                    'year': [],
-                    'figures' : [],
-                    'description' : [],
-                    'genre' : [] } 
-    for record in reader:
-        dict = save_to_dict(record, database_ret, dict)
-    df = pd.DataFrame.from_dict(dict)
-    df['figures'] = df['figures'].apply(lambda x: ';'.join(x))
-    df['description'] = df['description'].apply(lambda x: ';'.join(x))
-    df['genre'] = df['genre'].apply(lambda x: ';'.join(x))
-    df.to_csv(out_ret, encoding = 'utf8', sep = ",")     
-    
-with open(in_smz, 'rb') as data:
-    reader = MARCReader(data)
-    dict = {'title': [], 
-                    'author': [],
-                    'author code': [],
-                    'year': [],
-                    'figures' : [],
-                    'description' : [],
-                    'genre' : [] } 
-    for record in reader:
-        dict = save_to_dict(record, database_smz, dict)
-    df = pd.DataFrame.from_dict(dict)
-    df['figures'] = df['figures'].apply(lambda x: ';'.join(x))
-    df['description'] = df['description'].apply(lambda x: ';'.join(x))
-    df['genre'] = df['genre'].apply(lambda x: ';'.join(x))
-    df.to_csv(out_smz, encoding = 'utf8', sep = ",")              
\ No newline at end of file
+# Prazdny slovnik pro jednu davku zaznamu
+def new_dict():
+    return {'title': [], 
+            'author': [],
+            'author code': [],
+            'year': [],
+            'figures' : [],
+            'description' : [],
+            'genre' : [] } 
+
+
+# Zaznamy z databaze cteme po davkach, v pameti je vzdy nejvyse batch_size zaznamu.
+# Prubeh a chyby sleduje Run (viz instrumentation.py)
+def read_database(in_path, database):
+    with Run('save_to_dict ' + in_path, file_size(in_path)) as run, open_input(in_path) as data:
+        reader = MARCReader(data)
+        dict = new_dict()
+        for record in reader:
+            dict = save_to_dict(record, database, dict, run)
+            run.record(position=input_position(data))
+            if len(dict['year']) >= batch_size:
+                yield dict
+                dict = new_dict()
+        yield dict
+
+
+# Davky se berou z cache (viz record_cache.py), .mrc soubor se znovu cte jen pri jeho zmene.
+# Pri zmene funkce save_to_dict je potreba cache smazat: python record_cache.py clear
+def save_database(in_path, database, out_path):
+    writer = TableWriter(out_path, list(new_dict().keys()), batch_size)
+    for dict in cache.batches(in_path, ('save_to_dict', database), lambda: read_database(in_path, database)):
+        writer.write_batch(dict)
+    writer.close()
+
+
+cache = RecordCache()
+save_database(in_int, database_int, out_int)
+save_database(in_B, databases_B, out_B)
+save_database(in_cle, database_cle, out_cle)
+save_database(in_ret, database_ret, out_ret)
+save_database(in_smz, database_smz, out_smz)
@@ -0,0 +1,118 @@
+import re
+
+# Seznam poli, ktere si z marcovych zaznamu ukladame do tabulek.
+# Kazdy tuple je (nazev sloupce, tag pole, tag podpole nebo slice)
+field_list = [('title', '245', 'a'),
+              ('author', '100', 'a'),
+              ('author code', '100', '7'),
+              # Rok je schovany v poli 008 na 8. az 11. miste, proto vyuzijeme funkci slice
+              ('year', '008', slice(7, 11, None)),
+              ('figures', '600', 'a'),
+              ('figures code', '600', '7'),
+              ('description', '650', 'a'),
+              ('genre', '655', 'a'),
+              ('magazine', '773', 't')]
+
+
+# Nazev casopisu pred zavorkou a misto vydani v kulatych zavorkach, napr. 'Svědectví (Paříž)'
+pattern_magazine = re.compile(r"^(.*?)\s*(?=\()")
+pattern_place = re.compile(r"\((.*?)\)")
+
+# Opravy mist vydani: (cast udaje o miste, mista, kterymi se cely udaj nahradi).
+# Sjednocuji ceske a puvodni nazvy, opravuji preklepy a rozdeluji udaje s vice mesty
+aliases = [('London', ['Londýn']),
+           ('Obstladen', ['Winterthur', 'Obstalden']),
+           ('New York-Paříž', ['New York', 'Paříž']),
+           ('Ženeva-Middlesex-Mnichov', ['Ženeva', 'Middlesex', 'Mnichov']),
+           ('Köln-Ehrenfeld', ['Kolín nad Rýnem'])]
+
+
+# Udaj o miste upravime podle aliases. Vraci list mist (udaj muze obsahovat vice mest)
+def normalize_place(value):
+    value = value.strip()
+    for (part, places) in aliases:
+        if part in value:
+            return list(places)
+    return [value]
+
+
+def normalize_places(values):
+    return [place for value in values if value is not None for place in normalize_place(value)]
+
+
+# Nazev casopisu bez mista vydani
+def magazine_name(value):
+    match = pattern_magazine.search(value)
+    return [(match.group(1) if match else value).strip()]
+
+
+# Mista vydani casopisu (zadne, pokud v udaji nejsou)
+def magazine_places(value):
+    match = pattern_place.search(value)
+    return normalize_place(match.group(1)) if match else []
+
+
+# Sloupce odvozene z jinych sloupcu pri extrakci:
+# (nazev sloupce, zdrojovy sloupec, funkce, ktera z jedne hodnoty udela list hodnot)
+derived_columns = [('magazine name', 'magazine', magazine_name),
+                   ('place', 'magazine', magazine_places)]
+
+
+# Vsechny sloupce tabulky: sloupce z field_list a odvozene sloupce, pokud je v tabulce jejich zdroj
+def table_columns(field_list):
+    columns = [t[0] for t in field_list]
+    return columns + [name for (name, source, _) in derived_columns if source in columns]
+
+
+# Z field_list vytvori funkci, ktera z jednoho zaznamu vytahne vsechny sloupce najednou.
+# Seznam se prevede na slovnik {tag: [(nazev sloupce, tag podpole nebo slice), ...]},
+# takze se kazde pole zaznamu projde jen jednou a podpole se ctou primo, bez prevodu pole na text.
+# Vracena funkce vraci slovnik {nazev sloupce: list hodnot}
+def compile_field_list(field_list):
+    columns = [t[0] for t in field_list]
+    plan = {}
+    for (column, tag, subfield_tag) in field_list:
+        plan.setdefault(tag, []).append((column, subfield_tag))
+
+    def extract(record):
+        row = {column: [] for column in columns}
+        for field in record.fields:
+            targets = plan.get(field.tag)
+            if targets is None:
+                continue
+            # Prvni hodnota kazdeho podpole (stejne jako field[tag podpole])
+            subfields = None
+            for (column, subfield_tag) in targets:
+                # Pole bez podpoli pridame cele
+                if subfield_tag is None:
+                    row[column].append(field.data)
+                # Cast pole, ktera neni definovana podpolem
+                elif isinstance(subfield_tag, slice):
+                    row[column].append(field.data[subfield_tag])
+                # Jinak jen hodnotu podpole (pokud ho pole obsahuje)
+                elif not field.control_field:
+                    if subfields is None:
+                        subfields = {}
+                        for subfield in field.subfields:
+                            subfields.setdefault(subfield.code, subfield.value)
+                    if subfield_tag in subfields:
+                        row[column].append(subfields[subfield_tag])
+        return row
+
+    return extract
+
+
+# Extrakce podle vychoziho field_list
+extract_record = compile_field_list(field_list)
+
+
+# U jmen chceme jmeno a prijmeni bez koncove carky ',' a u nazvu bez lomitka '/'.
+# Zaroven se doplni odvozene sloupce (nazev casopisu a misto vydani)
+def clean_record(row):
+    for column, chars in (('figures', ' ,'), ('author', ' ,'), ('title', ' /')):
+        if column in row:
+            row[column] = [y.strip(chars) if len(y) > 0 else y for y in row[column]]
+    for (name, source, function) in derived_columns:
+        if source in row:
+            row[name] = [value for y in row[source] for value in function(y)]
+    return row
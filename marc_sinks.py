@@ -0,0 +1,326 @@
+import csv
+import os
+import queue
+import threading
+import xml.etree.ElementTree as ET
+
+from pymarc.marcxml import record_to_xml_node
+
+from compressed_io import base_path, is_compressed, open_output as open_compressed
+from marc_fields import field_list, extract_record, clean_record, table_columns
+from marc_table import TableWriter
+from mrc_index import IndexBuilder, index_path, scan_index
+
+
+# Vsechny vystupy umi zaznam nejdrive serializovat (serialize) a pak zapsat (write_serialized).
+# Diky tomu muze serializace probehnout jinde (napr. v jinem procesu) nez samotny zapis.
+# Pri pokracovani po preruseni (viz split_databases.py) se vystup otevre s delkou length
+# z posledniho checkpointu: soubor se na ni zkrati a dalsi zaznamy se pripisuji na konec.
+# Vystupy s priponou komprese (napr. ucla_B.mrc.gz) se komprimuji po blocich (viz compressed_io.py),
+# v jejich zapisu po preruseni pokracovat nejde.
+#
+# Aby cteni a parsovani vstupu necekalo na zapis, zapisuje se pres WriterPool: serializovane zaznamy
+# se sbiraji po vystupech do bufferu a plne buffery zapisuji do souboru vlakna na pozadi.
+# Fronty vlaken jsou omezene, takze kdyz disk nestiha, parsovani se zastavi (backpressure)
+# a v pameti neni vic nez queue_size bufferu na vlakno. fsync se vola jen pri checkpointu
+# a pri zavreni vystupu, ke kterym se checkpoint uklada (close(sync=True)).
+
+# Velikost bufferu jednoho vystupu (v bajtech, resp. znacich) a pocet plnych bufferu ve fronte vlakna
+buffer_size = 4 * 1024 * 1024
+queue_size = 8
+
+
+# Otevre vystupni soubor, pri pokracovani zkraceny na length
+def open_output(path, mode, length=None, **kwargs):
+    if is_compressed(path):
+        if length is not None:
+            raise ValueError("Compressed output cannot be resumed: " + path)
+        return open_compressed(path, mode, **kwargs)
+    if length is None:
+        return open(path, mode, **kwargs)
+    os.truncate(path, length)
+    return open(path, mode.replace('w', 'a'), **kwargs)
+
+
+# Spolecny zaklad vystupu: zapis serializovanych dat do souboru. Kazdy vystup definuje
+# vlastni staticmethod serialize(record)
+class Sink:
+    # Vystup jde zkratit na delku z checkpointu a pokracovat v nem
+    resumable = True
+
+    def __init__(self, path, length=None):
+        self.path = path
+        self.file = open_output(path, 'wb', length)
+
+    def write_serialized(self, data):
+        self.file.write(data)
+
+    # Zapis vice serializovanych zaznamu najednou (jednim volanim write)
+    def write_batch(self, items):
+        self.file.write(b''.join(items))
+
+    def write(self, record):
+        self.write_serialized(self.serialize(record))
+
+    # Zapise vse na disk a vrati delku souboru pro checkpoint
+    def checkpoint(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return os.fstat(self.file.fileno()).st_size
+
+    # Se sync=True se soubor pred zavrenim zapise na disk (fsync), aby po smazani checkpointu
+    # nezustal na disku nedopsany vystup
+    def close(self, sync=False):
+        if sync:
+            self.checkpoint()
+        self.file.close()
+
+
+# Zapis zaznamu ve formatu ISO 2709 (.mrc). Zaroven se sestavuje index (viz mrc_index.py),
+# ktery se pri zavreni ulozi vedle souboru
+class MarcSink(Sink):
+    def __init__(self, path, length=None):
+        super().__init__(path, length)
+        # Pri pokracovani se index zaznamu, ktere uz v souboru jsou, sestavi znovu
+        self.index = scan_index(path) if length else IndexBuilder()
+
+    # as_marc() nastavi v navesti zaznamu kodovani (leader[9] = 'a'). Navesti vratime zpet, aby
+    # .mrk a .xml serializovane po .mrc byly stejne jako bez .mrc vystupu (nezalezi na poradi vystupu)
+    @staticmethod
+    def serialize(record):
+        coding_scheme = str(record.leader)[9:10]
+        data = record.as_marc()
+        if coding_scheme and str(record.leader)[9:10] != coding_scheme:
+            if isinstance(record.leader, str):
+                record.leader = record.leader[:9] + coding_scheme + record.leader[10:]
+            else:
+                record.leader.coding_scheme = coding_scheme
+        return data
+
+    def write_serialized(self, data):
+        self.file.write(data)
+        self.index.add(data)
+
+    def write_batch(self, items):
+        for data in items:
+            self.index.add(data)
+        self.file.write(b''.join(items))
+
+    def close(self, sync=False):
+        super().close(sync)
+        self.index.save(index_path(self.path), sync)
+
+
+# Zapis zaznamu v textovem formatu MARCMaker (.mrk), zaznamy oddelene prazdnym radkem
+class TextSink(Sink):
+    def __init__(self, path, length=None):
+        self.path = path
+        self.file = open_output(path, 'wt', length, encoding='utf8')
+        self.write_count = 1 if length else 0
+
+    @staticmethod
+    def serialize(record):
+        return str(record)
+
+    def write_serialized(self, data):
+        if self.write_count > 0:
+            self.file.write('\n')
+        self.file.write(data)
+        self.write_count += 1
+
+    def write_batch(self, items):
+        if not items:
+            return
+        if self.write_count > 0:
+            self.file.write('\n')
+        self.file.write('\n'.join(items))
+        self.write_count += len(items)
+
+
+# Zapis zaznamu jako MARCXML kolekce (.xml)
+class XmlSink(Sink):
+    def __init__(self, path, length=None):
+        self.path = path
+        self.file = open_output(path, 'wb', length)
+        if not length:
+            self.file.write(b'<?xml version="1.0" encoding="UTF-8"?>')
+            self.file.write(b'<collection xmlns="http://www.loc.gov/MARC21/slim">')
+
+    @staticmethod
+    def serialize(record):
+        return ET.tostring(record_to_xml_node(record), encoding='utf-8')
+
+    def close(self, sync=False):
+        self.file.write(b'</collection>')
+        super().close(sync)
+
+
+# Zapis vybranych poli do CSV, hodnoty spojene strednikem ';' jako v save_csv.py
+class CsvSink(Sink):
+    def __init__(self, path, length=None):
+        self.path = path
+        self.file = open_output(path, 'w', length, encoding='utf8', newline='')
+        self.writer = csv.writer(self.file)
+        if not length:
+            self.writer.writerow(table_columns(field_list))
+
+    @staticmethod
+    def serialize(record):
+        row = clean_record(extract_record(record))
+        return [';'.join(row[column]) for column in table_columns(field_list)]
+
+    def write_serialized(self, data):
+        self.writer.writerow(data)
+
+    def write_batch(self, items):
+        self.writer.writerows(items)
+
+
+# Zapis vybranych poli do Parquetu po davkach (viz marc_table.py). Parquet ma metadata na konci
+# souboru, nedokonceny soubor tedy nejde precist a v zapisu nejde pokracovat
+class ParquetSink(Sink):
+    resumable = False
+
+    def __init__(self, path, length=None):
+        if length is not None:
+            raise ValueError("Parquet output cannot be resumed: " + path)
+        if is_compressed(path):
+            raise ValueError("Parquet output is compressed internally, use a .parquet file: " + path)
+        self.path = path
+        self.writer = TableWriter(path, table_columns(field_list))
+
+    @staticmethod
+    def serialize(record):
+        return clean_record(extract_record(record))
+
+    def write_serialized(self, data):
+        self.writer.append(data)
+
+    def write_batch(self, items):
+        for data in items:
+            self.writer.append(data)
+
+    def checkpoint(self):
+        raise ValueError("Parquet output does not support checkpoints: " + self.path)
+
+    # Parquet se s checkpointem nepouziva, sync tu nic nedela
+    def close(self, sync=False):
+        self.writer.close()
+
+
+sink_types = {'.mrc': MarcSink,
+              '.mrk': TextSink,
+              '.xml': XmlSink,
+              '.csv': CsvSink,
+              '.parquet': ParquetSink}
+
+
+# Typ vystupu podle pripony souboru (bez pripony komprese)
+def sink_type(path):
+    extension = os.path.splitext(base_path(path))[1].lower()
+    if extension not in sink_types:
+        raise ValueError("Unknown output format: " + path)
+    return sink_types[extension]
+
+
+# Jde v zapisu do vystupu pokracovat po preruseni (checkpoint)?
+def resumable(path):
+    return sink_type(path).resumable and not is_compressed(path)
+
+
+# Podle pripony souboru otevre spravny typ vystupu (pri pokracovani zkraceny na length)
+def open_sink(path, length=None):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return sink_type(path)(path, length)
+
+
+# Velikost serializovaneho zaznamu pro plneni bufferu (radek CSV je list stringu, radek Parquetu slovnik)
+def data_size(data):
+    if isinstance(data, (bytes, str)):
+        return len(data)
+    values = data.values() if isinstance(data, dict) else data
+    return sum(len(value) if isinstance(value, (bytes, str)) else 1 for value in values)
+
+
+# Zapis do vystupu ve vlaknech na pozadi. Kazdy vystup patri jednomu vlaknu (vystupy se rozdeli
+# mezi threads vlaken), takze zaznamy jednoho vystupu se zapisuji ve stejnem poradi, v jakem prisly.
+# Chyba pri zapisu ve vlakne se vyhodi v hlavnim vlakne pri dalsim volani write, flush nebo close
+class WriterPool:
+    def __init__(self, sinks, threads=1, buffer_size=buffer_size, queue_size=queue_size):
+        self.sinks = list(sinks)
+        self.buffer_size = buffer_size
+        self.buffers = {id(sink): [] for sink in self.sinks}
+        self.sizes = {id(sink): 0 for sink in self.sinks}
+        self.queues = [queue.Queue(queue_size) for _ in range(max(1, min(threads, len(self.sinks))))]
+        self.sink_queues = {id(sink): self.queues[i % len(self.queues)] for i, sink in enumerate(self.sinks)}
+        self.error = None
+        self.threads = [threading.Thread(target=self.work, args=(q,), daemon=True) for q in self.queues]
+        for thread in self.threads:
+            thread.start()
+
+    # Vlakno zapisuje davky z fronty, None znamena konec
+    def work(self, q):
+        while True:
+            item = q.get()
+            try:
+                if item is None:
+                    return
+                (sink, items) = item
+                if self.error is None:
+                    sink.write_batch(items)
+            except Exception as error:
+                self.error = error
+            finally:
+                q.task_done()
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def write(self, sink, data):
+        key = id(sink)
+        self.buffers[key].append(data)
+        self.sizes[key] += data_size(data)
+        if self.sizes[key] >= self.buffer_size:
+            self.send(sink)
+
+    def write_batch(self, sink, items):
+        for data in items:
+            self.write(sink, data)
+
+    # Preda buffer vystupu vlaknu (pri plne fronte ceka)
+    def send(self, sink):
+        key = id(sink)
+        if self.buffers[key]:
+            self.check()
+            self.sink_queues[key].put((sink, self.buffers[key]))
+            self.buffers[key] = []
+            self.sizes[key] = 0
+
+    # Preda vsechny buffery a pocka, az se zapisou
+    def flush(self):
+        for sink in self.sinks:
+            self.send(sink)
+        for q in self.queues:
+            q.join()
+        self.check()
+
+    # Zapise vse na disk (fsync) a vrati delky vystupu pro checkpoint {cesta: delka}
+    def checkpoint(self):
+        self.flush()
+        return {sink.path: sink.checkpoint() for sink in self.sinks}
+
+    # Dopise buffery, ukonci vlakna a zavre vystupy (i kdyz zapis selhal). Se sync=True
+    # se vystupy pred zavrenim zapisi na disk (fsync), viz Sink.close
+    def close(self, sync=False):
+        try:
+            self.flush()
+        finally:
+            for q in self.queues:
+                q.put(None)
+            for thread in self.threads:
+                thread.join()
+            for sink in self.sinks:
+                sink.close(sync)
@@ -0,0 +1,156 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from marc_fields import derived_columns
+
+
+# Vsechny sloupce krome roku ukladame jako list stringu
+year_column = 'year'
+
+
+# Hodnota v bunce muze byt list, string nebo None. Vzdy z ni udelame list
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [str(v) for v in value if v is not None]
+
+
+# Rok z pole 008 (napr. '1978' nebo ['1978']) prevedeme na cislo. Pokud rok chybi nebo
+# neni cely vyplneny (napr. '19uu'), vratime None
+def as_year(value):
+    values = as_list(value)
+    if len(values) > 0 and values[0].isnumeric():
+        return int(values[0])
+    return None
+
+
+# Roky jako pole int16 (napr. pro numpy), chybejici rok je missing_year
+missing_year = -1
+
+
+def year_array(column):
+    if isinstance(column, np.ndarray) and pd.api.types.is_numeric_dtype(column):
+        return column.astype(np.int16)
+    if pd.api.types.is_numeric_dtype(column):
+        return column.fillna(missing_year).to_numpy(dtype=np.int16)
+    return np.array([missing_year if year is None else year for year in map(as_year, column)], dtype=np.int16)
+
+
+# Prevede tabulku na Arrow se sloupci typu list<string> a rokem jako int16
+def to_arrow(df):
+    import pyarrow as pa
+
+    arrays = {}
+    for column in df.columns:
+        if column == year_column:
+            arrays[column] = pa.array([as_year(v) for v in df[column]], type=pa.int16())
+        else:
+            arrays[column] = pa.array([as_list(v) for v in df[column]], type=pa.list_(pa.string()))
+    return pa.table(arrays)
+
+
+# Prubezny zapis tabulky po davkach. Radky (slovniky {sloupec: hodnota}) se sbiraji v pameti
+# a po batch_size zaznamech se zapisou na konec souboru, takze v pameti je vzdy jen jedna davka.
+# Format se urci podle pripony souboru (.csv nebo .parquet), u Parquetu je kazda davka jedna row group
+class TableWriter:
+    def __init__(self, path, columns, batch_size=50000):
+        self.path = path
+        self.columns = columns
+        self.batch_size = batch_size
+        self.parquet = os.path.splitext(path)[1].lower() == '.parquet'
+        self.batch = {column: [] for column in columns}
+        self.rows = 0
+        self.writer = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def append(self, row):
+        for column in self.columns:
+            self.batch[column].append(row.get(column))
+        if len(self.batch[self.columns[0]]) >= self.batch_size:
+            self.flush()
+
+    # Zapise celou davku najednou (slovnik listu nebo DataFrame)
+    def write_batch(self, data):
+        df = pd.DataFrame.from_dict(data) if isinstance(data, dict) else data
+        if len(df) == 0:
+            return
+        if self.parquet:
+            import pyarrow.parquet as pq
+
+            table = to_arrow(df)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        else:
+            df = df.copy()
+            for column in df.columns:
+                df[column] = df[column].apply(lambda x: ';'.join(as_list(x)))
+            # Index pokracuje i v dalsich davkach, jako by se zapsal jeden velky DataFrame
+            df.index = range(self.rows, self.rows + len(df))
+            df.to_csv(self.path, encoding='utf8', sep=',', mode='w' if self.rows == 0 else 'a',
+                      header=self.rows == 0)
+        self.rows += len(df)
+
+    def flush(self):
+        self.write_batch(self.batch)
+        self.batch = {column: [] for column in self.columns}
+
+    def close(self):
+        self.flush()
+        # Prazdny vystup zapiseme aspon s hlavickou
+        if self.rows == 0:
+            if self.parquet:
+                import pyarrow.parquet as pq
+
+                pq.write_table(to_arrow(pd.DataFrame(columns=self.columns)), self.path)
+            else:
+                pd.DataFrame(columns=self.columns).to_csv(self.path, encoding='utf8', sep=',')
+        elif self.writer is not None:
+            self.writer.close()
+
+
+# Ulozi slovnik listu nebo DataFrame. Format se urci podle pripony souboru (.csv nebo .parquet)
+def save_table(data, path):
+    df = pd.DataFrame.from_dict(data) if isinstance(data, dict) else data
+    writer = TableWriter(path, list(df.columns), batch_size=max(len(df), 1))
+    writer.write_batch(df)
+    writer.close()
+
+
+# Nacte tabulku ulozenou pomoci save_table. U Parquetu se nacitaji jen sloupce v columns
+# a listy neni potreba znovu rozdelovat. U CSV hodnoty rozdelime podle stredniku ';'
+def load_table(path, columns=None):
+    if os.path.splitext(path)[1].lower() == '.parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Rok nechame jako int16 (i s chybejicimi hodnotami), listy zustanou listy
+        table = pq.read_table(path, columns=columns)
+        return add_derived_columns(table.to_pandas(types_mapper={pa.int16(): pd.Int16Dtype()}.get))
+
+    df = pd.read_csv(path, delimiter=',', dtype='str')
+    # Odstraneni zbytecneho sloupce s indexem
+    if 'Unnamed: 0' in df.columns:
+        df = df.drop(['Unnamed: 0'], axis=1)
+    if columns is not None:
+        df = df[columns]
+    for column in df.columns:
+        if column == year_column:
+            df[column] = df[column].apply(as_year).astype('Int16')
+        else:
+            df[column] = df[column].apply(lambda x: x.split(';') if isinstance(x, str) else [])
+    return add_derived_columns(df)
+
+
+# Doplni odvozene sloupce (nazev casopisu a misto vydani, viz marc_fields.py), ktere starsi tabulky nemaji
+def add_derived_columns(df):
+    for (name, source, function) in derived_columns:
+        if name not in df.columns and source in df.columns:
+            df[name] = df[source].apply(lambda values: [value for y in values for value in function(y)])
+    return df
@@ -0,0 +1,196 @@
+import os
+from array import array
+
+import numpy as np
+from pymarc import Record
+
+from compressed_io import base_path, read_range
+from mrc_mmap import MmapReader
+
+# Index k souboru .mrc: pro kazdy zaznam jeho pozice v souboru, delka, id z pole 001,
+# rok z pole 008 a kody databazi z pole 964. Uklada se vedle .mrc jako <nazev>.idx.npy
+# a nacita se pres mmap, takze pocty zaznamu a roky neni potreba cist ze zaznamu.
+
+# Kody z pole 964, kazdy ma v indexu jeden bit. Ostatni kody maji spolecny posledni bit
+codes = ['B12', 'B45', 'B70', 'B80', 'B97', 'CLE', 'SMZ', 'INT', 'RET', 'TRL', 'ALKARO']
+code_bits = {code: 1 << i for i, code in enumerate(codes)}
+other_code_bit = 1 << 31
+
+# Zaznamy jsou v indexu serazene podle id, aby se dalo hledat pomoci binarniho vyhledavani.
+# Sirka pole id je aspon id_width bajtu, delsi id z pole 001 ji zvetsi, aby se neorizla
+id_width = 24
+
+
+def index_dtype(width=id_width):
+    return np.dtype([('id', 'S{}'.format(width)),
+                     ('offset', '<u8'),
+                     ('length', '<u4'),
+                     ('year', '<i2'),
+                     ('codes', '<u4')])
+
+
+# Oddelovace v ISO 2709
+field_terminator = b'\x1e'
+subfield_delimiter = b'\x1f'
+
+
+# Cesta k indexu pro dany .mrc soubor (i komprimovany, napr. ucla_B.mrc.gz -> ucla_B.idx.npy)
+def index_path(mrc_path):
+    return os.path.splitext(base_path(mrc_path))[0] + '.idx.npy'
+
+
+# Data vsech poli s danym tagem primo z bajtu zaznamu (bez prevodu na pymarc Record).
+# Adresar zaznamu zacina za navestim (24 bajtu), kazda polozka ma 12 bajtu: tag, delka, pozice
+def field_data(data, tag):
+    base = int(data[12:17])
+    position = 24
+    values = []
+    while data[position:position + 1] != field_terminator and position + 12 <= len(data):
+        if data[position:position + 3] == tag:
+            length = int(data[position + 3:position + 7])
+            start = base + int(data[position + 7:position + 12])
+            values.append(data[start:start + length - 1])
+        position += 12
+    return values
+
+
+# Id, rok a kody databazi z bajtu jednoho zaznamu
+def parse_entry(data):
+    record_id = b''
+    year = -1
+    mask = 0
+    try:
+        ids = field_data(data, b'001')
+        if ids:
+            record_id = ids[0].strip()
+        fixed = field_data(data, b'008')
+        if fixed and fixed[0][7:11].isdigit():
+            year = int(fixed[0][7:11])
+        mask = codes_mask(field_data(data, b'964'))
+    except ValueError:
+        pass
+    return (record_id, year, mask)
+
+
+# Postupne sestavuje index behem zapisu .mrc souboru
+class IndexBuilder:
+    def __init__(self):
+        self.ids = []
+        self.offsets = array('Q')
+        self.lengths = array('L')
+        self.years = array('h')
+        self.codes = array('L')
+        self.position = 0
+
+    # Prida zaznam, ktery se prave zapsal na konec souboru
+    def add(self, data):
+        (record_id, year, mask) = parse_entry(data)
+        self.add_entry(self.position, len(data), record_id, year, mask)
+
+    def add_entry(self, offset, length, record_id, year, mask):
+        self.ids.append(record_id)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        self.years.append(year)
+        self.codes.append(mask)
+        self.position = offset + length
+
+    def to_array(self):
+        width = max([id_width] + [len(record_id) for record_id in self.ids])
+        index = np.empty(len(self.ids), dtype=index_dtype(width))
+        index['id'] = self.ids
+        index['offset'] = self.offsets
+        index['length'] = self.lengths
+        index['year'] = self.years
+        index['codes'] = self.codes
+        return np.sort(index, order='id', kind='stable')
+
+    # Se sync=True se index zapise na disk (fsync), viz Sink.close v marc_sinks.py
+    def save(self, path, sync=False):
+        with open(path, 'wb') as file:
+            np.save(file, self.to_array())
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+
+
+# Kody databazi z pole 964 jako bitova maska
+def codes_mask(fields_964):
+    mask = 0
+    for field in fields_964:
+        for subfield in bytes(field).split(subfield_delimiter)[1:]:
+            if subfield[:1] == b'a':
+                mask |= code_bits.get(subfield[1:].decode('utf8', 'replace'), other_code_bit)
+    return mask
+
+
+# IndexBuilder se zaznamy existujiciho .mrc souboru (napr. pro pokracovani v zapisu).
+# Soubor se cte pres mmap (viz mrc_mmap.py), takze se cte jen navesti, adresar a pole 001, 008 a 964,
+# zaznamy se nedekoduji
+def scan_index(mrc_path):
+    builder = IndexBuilder()
+    with MmapReader(mrc_path) as reader:
+        for view in reader:
+            try:
+                record_id = (view.id or '').encode('utf8')
+                year = view.year
+                mask = codes_mask(view.fields('964'))
+            except ValueError:
+                (record_id, year, mask) = (b'', None, 0)
+            builder.add_entry(view.offset, view.length, record_id, -1 if year is None else year, mask)
+    return builder
+
+
+# Sestavi index pro existujici .mrc soubor
+def build_index(mrc_path, save=True):
+    builder = scan_index(mrc_path)
+    if save:
+        builder.save(index_path(mrc_path))
+    return builder.to_array()
+
+
+# Nacte index (pres mmap). Pokud index chybi nebo je starsi nez .mrc, sestavi ho znovu
+def open_index(mrc_path):
+    path = index_path(mrc_path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(mrc_path):
+        return np.load(path, mmap_mode='r')
+    return build_index(mrc_path)
+
+
+def count_records(index):
+    return len(index)
+
+
+# Nejstarsi a nejnovejsi rok. Zaznamy bez roku se nepocitaji
+def year_range(index):
+    years = np.asarray(index['year'])
+    years = years[years >= 0]
+    if len(years) == 0:
+        return (None, None)
+    return (int(years.min()), int(years.max()))
+
+
+# Maska zaznamu, ktere maji v poli 964 dany kod
+def has_code(index, code):
+    return (np.asarray(index['codes']) & code_bits.get(code, other_code_bit)) != 0
+
+
+# Polozka indexu pro zaznam s danym id, nebo None
+def find_entry(index, record_id):
+    if isinstance(record_id, str):
+        record_id = record_id.encode('utf8')
+    position = np.searchsorted(index['id'], record_id)
+    if position < len(index) and index['id'][position] == record_id:
+        return index[position]
+    return None
+
+
+# Nacte jeden zaznam podle id bez cteni celeho souboru. U komprimovaneho souboru zapsaneho
+# po blocich se rozbali jen blok se zaznamem (viz compressed_io.py)
+def fetch_record(mrc_path, record_id, index=None):
+    if index is None:
+        index = open_index(mrc_path)
+    entry = find_entry(index, record_id)
+    if entry is None:
+        return None
+    return Record(read_range(mrc_path, int(entry['offset']), int(entry['length'])))
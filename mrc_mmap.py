@@ -0,0 +1,141 @@
+import mmap
+import os
+from collections import Counter
+
+from pymarc import Record
+
+from compressed_io import BlockBuffer, is_compressed
+
+# Cteni .mrc souboru pres mmap. Zaznamy se nedekoduji, ctenar vraci jen "pohledy" (RecordView)
+# na bajty v souboru. Adresar zaznamu se rozparsuje az ve chvili, kdy je potreba,
+# a data pole se vraci jako memoryview bez kopirovani zbytku zaznamu.
+# Komprimovany soubor (napr. .mrc.gz) se mapovat neda. Cte se po blocich (viz BlockBuffer v compressed_io.py),
+# rozbaluji se jen bloky, ve kterych jsou ctene zaznamy, takze musi byt zapsany po blocich (napr. ze split).
+
+field_terminator = 0x1e
+
+
+class RecordView:
+    __slots__ = ('buffer', 'offset', 'length', '_directory')
+
+    def __init__(self, buffer, offset, length):
+        self.buffer = buffer
+        self.offset = offset
+        self.length = length
+        self._directory = None
+
+    @property
+    def leader(self):
+        return bytes(self.buffer[self.offset:self.offset + 24]).decode('ascii', 'replace')
+
+    # Adresar zaznamu: {tag: [(pozice dat v souboru, delka bez oddelovace), ...]}
+    def directory(self):
+        if self._directory is None:
+            base = self.offset + int(bytes(self.buffer[self.offset + 12:self.offset + 17]))
+            entries = bytes(self.buffer[self.offset + 24:base])
+            directory = {}
+            for position in range(0, len(entries) - 11, 12):
+                if entries[position] == field_terminator:
+                    break
+                tag = entries[position:position + 3].decode('ascii', 'replace')
+                length = int(entries[position + 3:position + 7])
+                start = base + int(entries[position + 7:position + 12])
+                directory.setdefault(tag, []).append((start, length - 1))
+            self._directory = directory
+        return self._directory
+
+    # Data vsech poli s danym tagem jako memoryview
+    def fields(self, tag):
+        return [self.buffer[start:start + length] for (start, length) in self.directory().get(tag, [])]
+
+    # Data prvniho pole s danym tagem jako memoryview, nebo None
+    def field(self, tag):
+        entries = self.directory().get(tag)
+        if not entries:
+            return None
+        (start, length) = entries[0]
+        return self.buffer[start:start + length]
+
+    @property
+    def id(self):
+        data = self.field('001')
+        return None if data is None else bytes(data).decode('utf8', 'replace').strip()
+
+    # Rok z pole 008 (pozice 7 az 10), nebo None, pokud neni cely vyplneny
+    @property
+    def year(self):
+        data = self.field('008')
+        if data is None:
+            return None
+        year = bytes(data[7:11])
+        return int(year) if year.isdigit() else None
+
+    def as_bytes(self):
+        return bytes(self.buffer[self.offset:self.offset + self.length])
+
+    # Plny pymarc zaznam, pokud ho opravdu potrebujeme
+    def to_record(self):
+        return Record(self.as_bytes())
+
+
+class MmapReader:
+    def __init__(self, path):
+        self.path = path
+        if is_compressed(path):
+            self.file = None
+            self.mmap = None
+            self.buffer = BlockBuffer(path)
+            return
+        self.file = open(path, 'rb')
+        if os.path.getsize(path) > 0:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.buffer = memoryview(self.mmap)
+        else:
+            self.mmap = None
+            self.buffer = memoryview(b'')
+
+    # Zaznamy jdou za sebou, delka zaznamu je v prvnich peti bajtech navesti
+    def __iter__(self):
+        position = 0
+        size = len(self.buffer)
+        while position + 24 <= size:
+            length = int(bytes(self.buffer[position:position + 5]))
+            if length < 24:
+                break
+            yield RecordView(self.buffer, position, length)
+            position += length
+
+    # Zaznam na dane pozici (napr. z indexu mrc_index.py)
+    def record_at(self, offset):
+        length = int(bytes(self.buffer[offset:offset + 5]))
+        return RecordView(self.buffer, offset, length)
+
+    # Pohledy na zaznamy jsou platne jen do zavreni ctenare
+    def close(self):
+        try:
+            self.buffer.release()
+            if self.mmap is not None:
+                self.mmap.close()
+        except BufferError:
+            # Nekdo jeste drzi memoryview do souboru, mmap se uvolni az s nim
+            pass
+        if self.file is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# Pocet zaznamu v souboru (cte se jen navesti)
+def count_records(path):
+    with MmapReader(path) as reader:
+        return sum(1 for _ in reader)
+
+
+# Pocet zaznamu v jednotlivych letech podle pole 008
+def year_histogram(path):
+    with MmapReader(path) as reader:
+        return Counter(view.year for view in reader)
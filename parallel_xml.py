@@ -0,0 +1,117 @@
+import io
+import os
+import re
+from collections import deque
+from multiprocessing import Pool, cpu_count
+
+from pymarc.marcxml import XmlHandler, parse_xml
+
+
+# regex pattern, ktery najde zacatek zaznamu <record> (i s prefixem, napr. <marc:record>)
+pattern_record = re.compile(rb'<(?:[\w.-]+:)?record[\s>/]')
+
+# regex pattern pro pocatecni tagy elementu (bez <?xml ...?> a <!-- ... -->)
+pattern_start_tag = re.compile(rb'<([\w.:-]+)[^>]*>')
+
+# Velikost jednoho kusu souboru, ktery zpracuje jeden proces
+chunk_size = 32 * 1024 * 1024
+
+# Kolik bajtu najednou cteme pri hledani hranice zaznamu
+scan_size = 1024 * 1024
+
+# Kolik kusu na jeden proces muze byt rozpracovanych najednou. Dalsi kus se zada az po prevzeti
+# vysledku, takze kdyz zapis nestiha, vysledky se nehromadi v pameti hlavniho procesu
+chunks_in_flight = 2
+
+
+# Najde prvni zacatek zaznamu od pozice position. Pokud zadny neni, vrati None
+def find_record_start(file, position):
+    file.seek(position)
+    overlap = b''
+    while True:
+        data = file.read(scan_size)
+        if not data:
+            return None
+        buffer = overlap + data
+        match = pattern_record.search(buffer)
+        if match:
+            return position - len(overlap) + match.start()
+        position += len(data)
+        overlap = buffer[-16:]
+
+
+# Rozdeli MARCXML soubor na kusy, ktere zacinaji na hranici <record>.
+# Vraci (hlavicka, paticka, [(start, konec), ...]). Hlavicka je vse pred prvnim zaznamem
+# (<?xml ...?><collection ...>), paticka je uzaviraci tag korenoveho elementu.
+def find_chunks(file_path, size=chunk_size):
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as file:
+        first = find_record_start(file, 0)
+        if first is None:
+            return (b'', b'', [])
+
+        file.seek(0)
+        header = file.read(first)
+        root = pattern_start_tag.findall(header)[-1]
+        footer = b'</' + root + b'>'
+
+        # Konec posledniho kusu je uzaviraci tag korenoveho elementu
+        file.seek(max(first, file_size - scan_size))
+        tail_start = file.tell()
+        tail = file.read()
+        end = tail.rfind(footer)
+        end = tail_start + end if end >= 0 else file_size
+
+        boundaries = [first]
+        while boundaries[-1] + size < end:
+            start = find_record_start(file, boundaries[-1] + size)
+            if start is None or start >= end:
+                break
+            boundaries.append(start)
+        boundaries.append(end)
+
+    chunks = list(zip(boundaries[:-1], boundaries[1:]))
+    return (header, footer, chunks)
+
+
+# Nacte zaznamy z jednoho kusu souboru
+def read_chunk(file_path, start, end, header, footer):
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    handler = XmlHandler()
+    parse_xml(io.BytesIO(header + data + footer), handler)
+    return handler.records
+
+
+def run_chunk(task):
+    (function, file_path, start, end, header, footer, args) = task
+    return function(read_chunk(file_path, start, end, header, footer), *args)
+
+
+# Zpracuje vybrane kusy souboru (napr. jen kusy za poslednim checkpointem). Vysledky se vraci
+# ve stejnem poradi jako chunks. Pri processes == 1 se kusy zpracuji postupne v tomto procesu.
+# Rozpracovanych kusu je nejvyse chunks_in_flight na proces (Pool.imap by zadal vsechny najednou)
+def map_chunks(function, file_path, header, footer, chunks, processes=None, args=()):
+    tasks = [(function, file_path, start, end, header, footer, args) for (start, end) in chunks]
+    if processes == 1:
+        for task in tasks:
+            yield run_chunk(task)
+        return
+    limit = (processes or cpu_count()) * chunks_in_flight
+    with Pool(processes) as pool:
+        pending = deque()
+        for task in tasks:
+            if len(pending) >= limit:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(run_chunk, (task,)))
+        while pending:
+            yield pending.popleft().get()
+
+
+# Paralelni obdoba map_xml. Funkce function(records, *args) se zavola v procesu pro kazdy kus
+# souboru a vysledky se vraci ve stejnem poradi, v jakem jsou kusy v souboru.
+# function musi byt definovana na urovni modulu, aby sla predat jinemu procesu.
+def imap_chunks(function, file_path, processes=None, args=(), size=chunk_size):
+    (header, footer, chunks) = find_chunks(file_path, size)
+    return map_chunks(function, file_path, header, footer, chunks, processes, args)
@@ -0,0 +1,244 @@
+import argparse
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from compressed_io import base_path
+from count_cube import build_cube, cube_path, database_name
+from inverted_index import build_inverted_index, encoded_table_path, inverted_index_path
+from mrc_index import count_records, open_index, year_range
+from ragged import load_ragged
+from split_databases import exports, print_report, split
+
+# Cele zpracovani jednim prikazem. Kroky (stages) jsou definovane nad soubory, ktere ctou (inputs)
+# a zapisuji (outputs). Krok zavisi na krocich, ktere zapisuji jeho vstupy, takze kroky tvori
+# orientovany acyklicky graf (DAG). Krok se preskoci, pokud jsou vsechny jeho vystupy novejsi nez
+# vstupy. Kroky, ktere na sobe nezavisi (napr. extrakce jednotlivych databazi), bezi soucasne
+# ve vice procesech.
+#
+# Pouziti:
+#   python pipeline.py                  cely pipeline
+#   python pipeline.py extract:uclo     jen vybrane kroky (podle zacatku nazvu) a kroky, na kterych zavisi
+#   python pipeline.py --list           vypise kroky a jestli jsou aktualni
+
+# Pocet zaznamu, ktere drzime v pameti, nez je zapiseme do souboru
+batch_size = 50000
+
+
+class Stage:
+    def __init__(self, name, inputs, outputs, function, args=()):
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.function = function
+        self.args = args
+
+    def missing_inputs(self):
+        return [path for path in self.inputs if not os.path.exists(path)]
+
+    # Vsechny vystupy existuji a nejstarsi z nich je novejsi nez nejnovejsi vstup
+    def up_to_date(self):
+        if not all(os.path.exists(path) for path in self.outputs):
+            return False
+        if not self.inputs:
+            return True
+        newest_input = max(os.path.getmtime(path) for path in self.inputs)
+        return min(os.path.getmtime(path) for path in self.outputs) >= newest_input
+
+
+# Kroky pipeline
+
+def split_export(file_path, routes, outputs, record_filter):
+    (counts, stats) = split(file_path, routes, outputs, record_filter)
+    print_report(counts, stats)
+
+
+# Tabulka, zakodovana tabulka a invertovany index (viz inverted_index.py) z jedne extrakce, radky tabulky jsou cisla zaznamu v indexu
+def extract_table(mrc_path, table_path):
+    build_inverted_index(mrc_path, table_path, encoded_table_path(mrc_path), batch_size)
+
+
+# Pocty zaznamu a rozsah let kazde databaze z indexu (stejne jako save_number_of_records.py)
+def count_databases(mrc_paths, out_path):
+    res = {}
+    for (database, path) in mrc_paths.items():
+        index = open_index(path)
+        (oldest, newest) = year_range(index)
+        if oldest is None:
+            (oldest, newest) = (2024, 0000)
+        res[database] = (count_records(index), oldest, newest)
+    pd.DataFrame.from_dict(res).to_csv(out_path, encoding='utf8', sep=",", index=False)
+
+
+def cube_tables(table_paths, out_path):
+    cube = build_cube({database_name(path): load_ragged(path) for path in table_paths})
+    cube.save(out_path)
+
+
+# Tabulka databaze: bud ji zapisuje uz split (vystup .csv/.parquet), nebo vznikne extrakci z .mrc
+def table_output(outputs):
+    for output in outputs:
+        if os.path.splitext(base_path(output))[1].lower() in ('.csv', '.parquet'):
+            return output
+    return None
+
+
+def mrc_output(outputs):
+    for output in outputs:
+        if os.path.splitext(base_path(output))[1].lower() == '.mrc':
+            return output
+    return None
+
+
+# Kroky pro vsechny exporty ze split_databases.py
+def build_stages(table_format='csv'):
+    stages = []
+    tables = []
+    for (export, (file_path, routes, outputs, record_filter)) in exports.items():
+        names = [name for (name, _, _) in routes]
+        stages.append(Stage('split:' + export, [file_path],
+                            [output.format(name) for name in names for output in outputs],
+                            split_export, (file_path, routes, outputs, record_filter)))
+
+        mrc = mrc_output(outputs)
+        table = table_output(outputs)
+        for name in names:
+            if table is not None:
+                tables.append(table.format(name))
+            elif mrc is not None:
+                table_path = 'data/csv/split/{}_{}.{}'.format(export, name, table_format)
+                stages.append(Stage('extract:{}_{}'.format(export, name), [mrc.format(name)],
+                                    [table_path, inverted_index_path(mrc.format(name)),
+                                     encoded_table_path(mrc.format(name))],
+                                    extract_table, (mrc.format(name), table_path)))
+                tables.append(table_path)
+
+        if mrc is not None:
+            mrc_paths = {name: mrc.format(name) for name in names}
+            count_path = 'data/csv/{}_number_of_records.csv'.format(export)
+            stages.append(Stage('count:' + export, list(mrc_paths.values()), [count_path],
+                                count_databases, (mrc_paths, count_path)))
+
+    stages.append(Stage('cube', tables, [cube_path], cube_tables, (tables, cube_path)))
+    return stages
+
+
+# Kroky, ktere zapisuji vstupy kroku: {nazev kroku: mnozina nazvu kroku}
+def dependencies(stages):
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            producers[output] = stage.name
+    return {stage.name: {producers[path] for path in stage.inputs if path in producers} for stage in stages}
+
+
+# Vybrane kroky (podle zacatku nazvu) a vsechny kroky, na kterych zavisi
+def select_stages(stages, targets=None):
+    if not targets:
+        return stages
+    depends = dependencies(stages)
+    selected = set()
+    pending = [stage.name for stage in stages if any(stage.name.startswith(target) for target in targets)]
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(depends[name])
+    return [stage for stage in stages if stage.name in selected]
+
+
+# Vystupy kroku, ktery spadl, oznacime jako zastarale (cas zmeny 0), aby nedokoncene soubory
+# nevypadaly jako aktualni a krok se priste spustil znovu
+def run_stage(function, args, outputs=()):
+    start = time.perf_counter()
+    try:
+        function(*args)
+    except BaseException:
+        for path in outputs:
+            if os.path.exists(path):
+                os.utime(path, (0, 0))
+        raise
+    return time.perf_counter() - start
+
+
+# Spusti kroky v poradi podle zavislosti. Krok se spusti, kdyz skoncily vsechny kroky, na kterych
+# zavisi, a neni aktualni (nebo force=True). Pri dry_run se kroky jen vypisou.
+# Vraci {nazev kroku: 'done', 'skipped', 'failed' nebo 'blocked'}
+def run_pipeline(stages, workers=None, force=False, dry_run=False):
+    depends = dependencies(stages)
+    names = {stage.name for stage in stages}
+    depends = {name: depends[name] & names for name in names}
+    status = {}
+    running = {}
+
+    def start_ready(pool):
+        for stage in stages:
+            if stage.name in status or stage.name in running.values():
+                continue
+            if not all(status.get(name) in ('done', 'skipped') for name in depends[stage.name]):
+                if any(status.get(name) in ('failed', 'blocked') for name in depends[stage.name]):
+                    status[stage.name] = 'blocked'
+                    print("Blocked " + stage.name)
+                continue
+            rerun_upstream = any(status[name] == 'done' for name in depends[stage.name])
+            if not force and not rerun_upstream and stage.up_to_date():
+                status[stage.name] = 'skipped'
+                print("Up to date " + stage.name)
+            elif dry_run:
+                status[stage.name] = 'done'
+                print("Would run " + stage.name)
+            elif stage.missing_inputs():
+                status[stage.name] = 'failed'
+                print("Failed " + stage.name + ": missing " + ", ".join(stage.missing_inputs()), file=sys.stderr)
+            else:
+                print("Running " + stage.name)
+                running[pool.submit(run_stage, stage.function, stage.args, stage.outputs)] = stage.name
+
+    with ProcessPoolExecutor(workers) as pool:
+        start_ready(pool)
+        # Po kazdem dokoncenem kroku se muzou spustit dalsi; blokovane kroky se oznaci v dalsich kolech
+        while running or len(status) < len(stages):
+            if not running:
+                start_ready(pool)
+                if not running:
+                    break
+                continue
+            (finished, _) = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    seconds = future.result()
+                    status[name] = 'done'
+                    print("Finished " + name + " in {:.1f} s".format(seconds))
+                except Exception as error:
+                    status[name] = 'failed'
+                    print("Failed " + name + ": " + type(error).__name__ + ": " + str(error), file=sys.stderr)
+                    traceback.print_exception(type(error), error, error.__traceback__)
+            start_ready(pool)
+    return status
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the processing pipeline (split, extract, count, cube).")
+    parser.add_argument('targets', nargs='*', help="stages to run (by name prefix), with everything they depend on")
+    parser.add_argument('--workers', type=int, default=None, help="number of stages run at once (default: all cores)")
+    parser.add_argument('--force', action='store_true', help="run the stages even if their outputs are up to date")
+    parser.add_argument('--dry-run', action='store_true', help="only print which stages would run")
+    parser.add_argument('--list', action='store_true', help="list the stages and whether they are up to date")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help="format of extracted tables")
+    arguments = parser.parse_args()
+
+    stages = select_stages(build_stages(arguments.format), arguments.targets)
+    if arguments.list:
+        depends = dependencies(stages)
+        for stage in stages:
+            state = 'up to date' if stage.up_to_date() else 'stale'
+            print("{:<24} {:<10} after: {}".format(stage.name, state, ", ".join(sorted(depends[stage.name])) or '-'))
+    else:
+        status = run_pipeline(stages, arguments.workers, arguments.force, arguments.dry_run)
+        if any(value in ('failed', 'blocked') for value in status.values()):
+            sys.exit(1)
@@ -0,0 +1,240 @@
+import os
+import re
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from marc_fields import derived_columns
+from marc_table import as_list, missing_year, year_array, year_column
+
+# Sloupce s vice hodnotami v jednom zaznamu (autori, osobnosti, temata, zanry, casopisy) jako
+# "ragged array": vsechny hodnoty za sebou v jednom poli a pole offsets, ktere rika, kde zacinaji
+# hodnoty jednotlivych zaznamu (hodnoty zaznamu i jsou na pozicich offsets[i] az offsets[i + 1]).
+# Hodnoty jsou ulozene jako kody (int32) do pole labels, kazdy text je v pameti jen jednou.
+# Misto listu v kazde bunce DataFramu a jejich rekurzivniho "zplostovani" (flatten_list) jsou
+# rozbaleni, vyber radku, pocty hodnot a pocty po letech operace nad celymi poli.
+
+
+class Ragged:
+    def __init__(self, codes, labels, offsets):
+        self.codes = codes
+        self.labels = labels
+        self.offsets = offsets
+
+    # Ze sloupce s listy (nebo stringy a None) v bunkach
+    @classmethod
+    def from_lists(cls, cells):
+        values = [as_list(cell) for cell in cells]
+        lengths = np.fromiter((len(value) for value in values), dtype=np.int64, count=len(values))
+        return cls.from_flat(list(chain.from_iterable(values)), lengths)
+
+    # Ze sloupce CSV, kde jsou hodnoty spojene strednikem ';' (prazdna bunka je NaN). Cely sloupec
+    # se spoji do jednoho stringu a rozdeli jednim volanim split, pocty hodnot se spocitaji z oddelovacu
+    @classmethod
+    def from_strings(cls, cells, separator=';'):
+        cells = pd.Series(cells, dtype=object)
+        present = cells.notna().to_numpy()
+        strings = cells[present]
+        lengths = np.zeros(len(cells), dtype=np.int64)
+        lengths[present] = strings.str.count(re.escape(separator)).to_numpy(dtype=np.int64) + 1
+        flat = separator.join(strings).split(separator) if len(strings) > 0 else []
+        return cls.from_flat(flat, lengths)
+
+    # Ze sloupce Arrow typu list<string> (Parquet), ktery uz offsets a hodnoty ma
+    @classmethod
+    def from_arrow(cls, column):
+        import pyarrow as pa
+
+        column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+        offsets = column.offsets.to_numpy().astype(np.int64)
+        # Chybejici list (null) ma stejny zacatek i konec, tedy zadne hodnoty
+        flat = column.values.slice(offsets[0], offsets[-1] - offsets[0]).to_pandas()
+        return cls.from_flat(flat, np.diff(offsets))
+
+    @classmethod
+    def from_flat(cls, flat, lengths):
+        (codes, labels) = pd.factorize(pd.Series(flat, dtype=object))
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(codes.astype(np.int32), np.asarray(labels, dtype=object), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    # Hodnoty zaznamu i jako list
+    def __getitem__(self, i):
+        return list(self.labels[self.codes[self.offsets[i]:self.offsets[i + 1]]])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    # Vsechny hodnoty za sebou (misto flatten_list)
+    @property
+    def values(self):
+        return self.labels[self.codes]
+
+    # Pocet hodnot v kazdem zaznamu
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    # Cislo zaznamu pro kazdou hodnotu
+    def rows(self):
+        return np.repeat(np.arange(len(self)), self.lengths())
+
+    # Rozbali sloupec: jedna hodnota na radek, index je cislo zaznamu (jako DataFrame.explode)
+    def explode(self):
+        return pd.Series(self.values, index=self.rows())
+
+    # Vybrane zaznamy (maska nebo cisla zaznamu). Slovnik labels zustava stejny
+    def take(self, rows):
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        starts = self.offsets[:-1][rows]
+        lengths = self.offsets[1:][rows] - starts
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return Ragged(self.codes[positions], self.labels, offsets)
+
+    # Stejny sloupec jen s hodnotami, ktere se v nem opravdu objevuji (napr. po take)
+    def compact(self):
+        (codes, used) = pd.factorize(self.codes)
+        return Ragged(codes.astype(np.int32), self.labels[used], self.offsets)
+
+    # Maska zaznamu, ktere obsahuji aspon jednu z hodnot
+    def contains(self, *values):
+        hit = np.isin(self.labels, list(values))[self.codes]
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.rows()[hit]] = True
+        return mask
+
+    # Pocet vyskytu kazde hodnoty, od nejcastejsi. Pri shode je drive ta, ktera se objevila driv
+    def value_counts(self):
+        counts = np.bincount(self.codes, minlength=len(self.labels))
+        order = np.argsort(-counts, kind='stable')
+        order = order[counts[order] > 0]
+        return pd.Series(counts[order], index=self.labels[order], name='count')
+
+    # Serazene unikatni hodnoty (jako np.unique(flatten_list(...)))
+    def unique(self):
+        used = np.bincount(self.codes, minlength=len(self.labels)) > 0
+        return np.unique(self.labels[used].astype(str))
+
+    # Pocty hodnot po letech: radky jsou roky, sloupce hodnoty. Zaznamy bez roku se nepocitaji.
+    # Pokud je zadano values, jsou ve vysledku jen tyto hodnoty (a v tomto poradi)
+    def year_counts(self, years, values=None):
+        keys = (np.repeat(np.asarray(years), self.lengths()).astype(np.int64) << 32) | self.codes
+        keys = keys[(keys >> 32) != missing_year]
+        (keys, counts) = np.unique(keys, return_counts=True)
+        df = pd.DataFrame({'year': keys >> 32, 'value': self.labels[keys & 0xffffffff], 'count': counts})
+        table = df.pivot_table(index='year', columns='value', values='count', aggfunc='sum', fill_value=0)
+        if values is not None:
+            table = table.reindex(columns=list(values), fill_value=0)
+        return table.sort_index()
+
+    # Zpet na listy (napr. pro sloupec DataFramu)
+    def to_lists(self):
+        return list(self)
+
+
+# Sloupec jako Ragged. DataFrame sloupce s listy v bunkach se prevedou, Ragged zustava
+def ragged(column):
+    if isinstance(column, Ragged):
+        return column
+    return Ragged.from_lists(column)
+
+
+# Tabulka se sloupcem roku (int16, chybejici rok je missing_year) a ostatnimi sloupci jako Ragged.
+# Ma rozhrani jako DataFrame tam, kde ho potrebuji build_cube, incidence, edge_table a encode_frame
+class RaggedTable:
+    def __init__(self, year, data):
+        self.year = year
+        self.data = dict(data)
+
+    def __len__(self):
+        return len(self.year)
+
+    @property
+    def columns(self):
+        return [year_column] + list(self.data)
+
+    def __getitem__(self, column):
+        if column == year_column:
+            return self.year
+        return self.data[column]
+
+    def __setitem__(self, column, values):
+        if column == year_column:
+            self.year = year_array(values)
+        else:
+            self.data[column] = ragged(values)
+
+    # Vybrane zaznamy (maska nebo cisla zaznamu)
+    def take(self, rows):
+        rows = np.asarray(rows)
+        return RaggedTable(self.year[rows], {column: values.take(rows) for (column, values) in self.data.items()})
+
+    # DataFrame s listy v bunkach (jako load_table)
+    def frame(self):
+        df = pd.DataFrame({year_column: pd.array(np.where(self.year == missing_year, None, self.year).tolist(),
+                                                 dtype='Int16')})
+        for (column, values) in self.data.items():
+            df[column] = values.to_lists()
+        return df
+
+    def head(self, n=5):
+        return self.take(np.arange(min(n, len(self)))).frame()
+
+    def tail(self, n=5):
+        rows = np.arange(max(len(self) - n, 0), len(self))
+        df = self.take(rows).frame()
+        df.index = rows
+        return df
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(year_array(df[year_column]),
+                   {column: ragged(df[column]) for column in df.columns if column != year_column})
+
+
+# Nacte tabulku ulozenou pomoci save_table (CSV nebo Parquet) primo jako RaggedTable,
+# bez listu v bunkach. U Parquetu se nacitaji jen sloupce v columns. Odvozene sloupce
+# (nazev casopisu a misto vydani, viz marc_fields.py), ktere starsi tabulky nemaji, se dopocitaji
+def load_ragged(path, columns=None):
+    parquet = os.path.splitext(path)[1].lower() == '.parquet'
+    if parquet:
+        import pyarrow.parquet as pq
+
+        available = pq.read_schema(path).names
+    else:
+        available = list(pd.read_csv(path, delimiter=',', dtype='str', nrows=0).columns)
+    wanted = available if columns is None else columns
+    derived = [(name, source, function) for (name, source, function) in derived_columns
+               if name not in available and source in available and (columns is None or name in columns)]
+    if columns is not None:
+        columns = list(dict.fromkeys([column for column in columns if column in available]
+                                     + [source for (_, source, _) in derived]))
+
+    if parquet:
+        table = pq.read_table(path, columns=columns)
+        year = table.column(year_column).to_pandas() if year_column in table.column_names else None
+        data = {name: Ragged.from_arrow(table.column(name)) for name in table.column_names if name != year_column}
+    else:
+        df = pd.read_csv(path, delimiter=',', dtype='str')
+        # Odstraneni zbytecneho sloupce s indexem
+        if 'Unnamed: 0' in df.columns:
+            df = df.drop(['Unnamed: 0'], axis=1)
+        if columns is not None:
+            df = df[columns]
+        year = df[year_column] if year_column in df.columns else None
+        data = {name: Ragged.from_strings(df[name]) for name in df.columns if name != year_column}
+
+    for (name, source, function) in derived:
+        data[name] = Ragged.from_lists([[value for y in values for value in function(y)] for values in data[source]])
+    if columns is not None:
+        data = {name: data[name] for name in wanted if name in data}
+    length = len(next(iter(data.values()))) if data else len(year)
+    return RaggedTable(year_array(year) if year is not None else np.full(length, missing_year, dtype=np.int16), data)
@@ -0,0 +1,211 @@
+import argparse
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+
+from pymarc import MARCReader
+
+from compressed_io import input_position, open_input
+from instrumentation import Run, file_size
+from marc_fields import compile_field_list, clean_record, table_columns
+
+# Sdilena cache vytazenych zaznamu na disku. Misto opakovaneho cteni .mrc souboru pres MARCReader
+# se ulozi uz vytazene davky (slovniky {sloupec: list hodnot}, jak je bere TableWriter.write_batch).
+# Klic polozky je hash obsahu zdrojoveho souboru a nastaveni extrakce (napr. field_list),
+# takze pri zmene souboru nebo seznamu poli se pouzije nova polozka.
+# Velikost cache je omezena, nejdele nepouzite polozky se mazou (LRU).
+#
+# Nastaveni extrakce (config) musi byt data s opakovatelnym repr (tuple, list, string, slice),
+# ne funkce. Pri zmene kodu extrakce je potreba cache smazat: python record_cache.py clear
+
+cache_directory = 'data/cache'
+
+# Nejvetsi velikost cache v bajtech
+cache_size = 2 * 1024 ** 3
+
+# Velikost bloku pri pocitani hashe souboru
+hash_block_size = 1024 * 1024
+
+
+class RecordCache:
+    def __init__(self, directory=cache_directory, max_size=cache_size):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(directory, 'cache.sqlite'), timeout=60)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS entries '
+                                '(key TEXT PRIMARY KEY, source TEXT, config TEXT, size INTEGER, used REAL, hits INTEGER)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS files '
+                                '(path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hash TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)')
+        self.connection.commit()
+
+    # Hash obsahu souboru. Pamatujeme si ho podle velikosti a casu zmeny souboru,
+    # aby se velky soubor nemusel cist pri kazdem pouziti cache
+    def file_hash(self, path):
+        status = os.stat(path)
+        key = os.path.abspath(path)
+        row = self.connection.execute('SELECT size, mtime, hash FROM files WHERE path = ?', (key,)).fetchone()
+        if row is not None and row[0] == status.st_size and row[1] == status.st_mtime_ns:
+            return row[2]
+        digest = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(hash_block_size), b''):
+                digest.update(block)
+        digest = digest.hexdigest()
+        self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                (key, status.st_size, status.st_mtime_ns, digest))
+        self.connection.commit()
+        return digest
+
+    def entry_key(self, path, config):
+        return hashlib.sha1((self.file_hash(path) + repr(config)).encode('utf8')).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def count(self, name):
+        self.connection.execute('INSERT INTO stats VALUES (?, 1) '
+                                'ON CONFLICT(name) DO UPDATE SET value = value + 1', (name,))
+
+    # Davky pro soubor path a nastaveni config. Pokud v cache nejsou, vytvori je funkce build
+    # (generator davek) a zaroven se ulozi. Polozka se ulozi, jen kdyz se build projde cely
+    def batches(self, path, config, build):
+        key = self.entry_key(path, config)
+        entry = self.entry_path(key)
+        if os.path.exists(entry):
+            self.count('hits')
+            self.connection.execute('UPDATE entries SET used = ?, hits = hits + 1 WHERE key = ?', (time.time(), key))
+            self.connection.commit()
+            with open(entry, 'rb') as file:
+                while True:
+                    try:
+                        yield pickle.load(file)
+                    except EOFError:
+                        return
+
+        self.count('misses')
+        self.connection.commit()
+        temporary = entry + '.tmp'
+        complete = False
+        try:
+            with open(temporary, 'wb') as file:
+                for batch in build():
+                    pickle.dump(batch, file, protocol=pickle.HIGHEST_PROTOCOL)
+                    yield batch
+            complete = True
+        finally:
+            if complete:
+                os.replace(temporary, entry)
+                self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, 0)',
+                                        (key, path, repr(config), os.path.getsize(entry), time.time()))
+                self.connection.commit()
+                self.evict()
+            elif os.path.exists(temporary):
+                os.remove(temporary)
+
+    # Smaze nejdele nepouzite polozky, dokud je cache vetsi nez max_size
+    def evict(self):
+        (total,) = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()
+        for (key, size) in self.connection.execute('SELECT key, size FROM entries ORDER BY used').fetchall():
+            if total <= self.max_size:
+                break
+            if os.path.exists(self.entry_path(key)):
+                os.remove(self.entry_path(key))
+            self.connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self.count('evictions')
+            total -= size
+        self.connection.commit()
+
+    def clear(self):
+        for (key,) in self.connection.execute('SELECT key FROM entries').fetchall():
+            if os.path.exists(self.entry_path(key)):
+                os.remove(self.entry_path(key))
+        self.connection.execute('DELETE FROM entries')
+        self.connection.execute('DELETE FROM stats')
+        self.connection.commit()
+
+    # Pocty zasahu, minuti a vyhozenych polozek, pocet polozek a jejich velikost
+    def stats(self):
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        stats.update(self.connection.execute('SELECT name, value FROM stats').fetchall())
+        (stats['entries'], stats['size']) = self.connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return stats
+
+    def entries(self):
+        return self.connection.execute('SELECT source, config, size, hits, used FROM entries ORDER BY used DESC').fetchall()
+
+    def close(self):
+        self.connection.close()
+
+
+# Davky vytazenych a upravenych zaznamu (viz clean_record) podle field_list.
+# Prubeh a chyby pri cteni souboru sleduje run (viz instrumentation.py)
+def extracted_batches(path, field_list, batch_size=50000, cache=None, run=None):
+    columns = table_columns(field_list)
+
+    def build():
+        extract = compile_field_list(field_list)
+        batch = {column: [] for column in columns}
+        current = Run('extract ' + path, file_size(path)) if run is None else run
+        try:
+            with open_input(path) as data:
+                for record in MARCReader(data):
+                    current.lap('parse')
+                    if record is None:
+                        continue
+                    try:
+                        row = clean_record(extract(record))
+                    except Exception as error:
+                        current.error(error, record)
+                        continue
+                    for column in columns:
+                        batch[column].append(row[column])
+                    current.lap('extract')
+                    current.record(position=input_position(data))
+                    if len(batch[columns[0]]) >= batch_size:
+                        yield batch
+                        # Cas, kdy byl generator pozastaveny, je zapis davky
+                        current.lap('write')
+                        batch = {column: [] for column in columns}
+            yield batch
+        finally:
+            if run is None:
+                current.close()
+
+    if cache is None:
+        cache = RecordCache()
+    return cache.batches(path, ('compile_field_list', field_list, columns), build)
+
+
+def format_size(size):
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if size < 1024 or unit == 'GiB':
+            return "{:.1f} {}".format(size, unit)
+        size /= 1024
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Show or clear the cache of extracted records.")
+    parser.add_argument('command', nargs='?', default='stats', choices=['stats', 'clear'])
+    parser.add_argument('--directory', default=cache_directory)
+    arguments = parser.parse_args()
+
+    cache = RecordCache(arguments.directory)
+    if arguments.command == 'clear':
+        cache.clear()
+        print("Cache cleared")
+    else:
+        stats = cache.stats()
+        requests = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / requests if requests > 0 else 0
+        print("Hits: {} Misses: {} Hit ratio: {:.1%} Evictions: {}".format(
+            stats['hits'], stats['misses'], ratio, stats['evictions']))
+        print("Entries: {} Size: {} of {}".format(
+            stats['entries'], format_size(stats['size']), format_size(cache.max_size)))
+        for (source, config, size, hits, used) in cache.entries():
+            print("  " + source + " " + format_size(size) + ", hits " + str(hits) + ", " + config[:60])
+    cache.close()
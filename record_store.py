@@ -0,0 +1,214 @@
+import argparse
+import os
+from array import array
+
+import numpy as np
+from pymarc import map_xml
+
+from compressed_io import base_path, input_position, is_compressed, open_input
+from instrumentation import Run, add_arguments, error_entry, file_size, run_from_arguments
+from marc_sinks import MarcSink, WriterPool, open_sink
+from mrc_mmap import MmapReader
+from parallel_xml import imap_chunks
+from split_databases import exports, select_databases
+
+# Spolecne uloziste zaznamu misto samostatnych .mrc souboru pro kazdou databazi. Zaznam, ktery patri
+# do vice databazi (napr. SMZ je v 1945 i v smz), je v ulozisti jen jednou. Zaznamy se neslucuji
+# podle id z pole 001: dva zaznamy exportu se stejnym id jsou v ulozisti oba (stejne jako je zapise
+# split), takze databaze z uloziste je po bajtech stejna jako vystup split. Pro kazdou databazi
+# je bitmapa (jeden bit na zaznam v poradi v ulozisti), ktera rika, jestli do ni zaznam patri.
+# Bitmapy se ukladaji zabalene (np.packbits) a komprimovane vedle uloziste jako <nazev>.members.npz.
+# Zaznamy databaze se ctou primo z uloziste (pres mmap, viz mrc_mmap.py), zaznamy ve vice
+# databazich najednou jsou AND bitmap. Uloziste je obycejny .mrc soubor s indexem (viz mrc_index.py).
+#
+# Pouziti:
+#   python record_store.py uclo                     sestavi uloziste exportu uclo
+#   python record_store.py uclo --both 1945 smz     pocet zaznamu, ktere jsou v obou databazich
+#   python record_store.py uclo --write smz out.mrc zapise databazi jako samostatny soubor
+
+
+def store_path(export):
+    return 'data/{0}/{0}_store.mrc'.format(export)
+
+
+def members_path(path):
+    return os.path.splitext(base_path(path))[0] + '.members.npz'
+
+
+# Zpracovani jednoho kusu souboru v paralelnim rezimu: (serializovany zaznam, nazvy databazi)
+# pro zaznamy, ktere patri aspon do jedne databaze
+def store_chunk(records, routes, record_filter):
+    entries = []
+    errors = []
+    for r in records:
+        try:
+            (names, _) = select_databases(r, routes, record_filter)
+            if names:
+                entries.append((MarcSink.serialize(r), names))
+        except Exception as error:
+            errors.append(error_entry(error, r))
+    return (entries, errors, len(records))
+
+
+# Sestavi uloziste z MARCXML exportu. Vraci pocty zaznamu v jednotlivych databazich a statistiky
+def build_store(file_path, routes, path, record_filter=None, processes=1, run=None):
+    if is_compressed(file_path) and processes != 1:
+        raise ValueError("compressed input is only supported with processes=1")
+    names = [name for (name, _, _) in routes]
+    if len(names) > 32:
+        raise ValueError("the record store supports at most 32 databases")
+    bits = {name: 1 << i for i, name in enumerate(names)}
+    own_run = run is None
+    if own_run:
+        run = Run('store ' + file_path, file_size(file_path))
+
+    sink = open_sink(path)
+    writer = WriterPool([sink])
+    # Maska databazi kazdeho zaznamu v poradi v ulozisti
+    masks = array('L')
+    stats = {'records': 0, 'copies avoided': 0, 'bytes avoided': 0}
+
+    def add(data, record_names):
+        mask = 0
+        for name in record_names:
+            mask |= bits[name]
+            run.count(name)
+        masks.append(mask)
+        writer.write(sink, data)
+        stats['records'] += 1
+        stats['copies avoided'] += len(record_names) - 1
+        stats['bytes avoided'] += (len(record_names) - 1) * len(data)
+
+    def store_record(r):
+        run.lap('parse')
+        try:
+            (record_names, _) = select_databases(r, routes, record_filter)
+            if record_names:
+                add(MarcSink.serialize(r), record_names)
+        except Exception as error:
+            run.error(error, r)
+        run.lap('write')
+        run.record(position=input_position(xml_file))
+
+    try:
+        if processes == 1:
+            with open_input(file_path) as xml_file:
+                map_xml(store_record, xml_file)
+        else:
+            for (entries, errors, read) in imap_chunks(store_chunk, file_path, processes, (routes, record_filter)):
+                run.lap('parse')
+                for (data, record_names) in entries:
+                    add(data, record_names)
+                for entry in errors:
+                    run.log(entry)
+                run.lap('write')
+                run.record(read)
+    finally:
+        writer.close()
+        if own_run:
+            run.close()
+
+    masks = np.array(masks, dtype=np.uint32)
+    members = (masks[None, :] >> np.arange(len(names), dtype=np.uint32)[:, None]) & 1
+    with MmapReader(path) as reader:
+        offsets = np.fromiter((view.offset for view in reader), dtype=np.uint64, count=len(masks))
+    np.savez_compressed(members_path(path), names=np.array(names, dtype=str), count=len(masks),
+                        offsets=offsets, bits=np.packbits(members.astype(bool), axis=1))
+    counts = {name: int(members[i].sum()) for i, name in enumerate(names)}
+    return (counts, stats)
+
+
+class RecordStore:
+    def __init__(self, path):
+        self.path = path
+        with np.load(members_path(path)) as data:
+            self.names = [str(name) for name in data['names']]
+            self.count = int(data['count'])
+            self.offsets = data['offsets']
+            self.bits = data['bits']
+        self.reader = MmapReader(path)
+
+    def __len__(self):
+        return self.count
+
+    def database(self, name):
+        if name not in self.names:
+            raise ValueError("Unknown database: " + name + " (store has " + ", ".join(self.names) + ")")
+        return self.names.index(name)
+
+    # Zabalena bitmapa zaznamu, ktere jsou ve vsech zadanych databazich (AND)
+    def packed(self, *names):
+        if not names:
+            raise ValueError("No database given")
+        return np.bitwise_and.reduce(self.bits[[self.database(name) for name in names]], axis=0)
+
+    # Maska (bool pro kazdy zaznam uloziste) zaznamu, ktere jsou ve vsech zadanych databazich
+    def members(self, *names):
+        return np.unpackbits(self.packed(*names), count=self.count).astype(bool)
+
+    # Pocet zaznamu, ktere jsou ve vsech zadanych databazich
+    def count_members(self, *names):
+        return int(np.unpackbits(self.packed(*names), count=self.count).sum())
+
+    def counts(self):
+        return {name: self.count_members(name) for name in self.names}
+
+    # Pohledy na zaznamy (viz mrc_mmap.py) v zadanych databazich, v poradi v ulozisti
+    def views(self, *names):
+        for offset in self.offsets[self.members(*names)]:
+            yield self.reader.record_at(int(offset))
+
+    def records(self, *names):
+        for view in self.views(*names):
+            yield view.to_record()
+
+    # Zapise zaznamy databaze do samostatneho souboru (format podle pripony, viz marc_sinks.py)
+    def write_database(self, name, path):
+        sink = open_sink(path)
+        for view in self.views(name):
+            if isinstance(sink, MarcSink):
+                sink.write_serialized(view.as_bytes())
+            else:
+                sink.write(view.to_record())
+        sink.close()
+
+    def close(self):
+        self.reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build a deduplicated record store with per-database bitmaps.")
+    parser.add_argument('export', help="export to store: " + ", ".join(exports))
+    parser.add_argument('--output', default=None, help="store .mrc (default: data/<export>/<export>_store.mrc)")
+    parser.add_argument('--processes', type=int, default=1, help="number of worker processes (0 = all cores)")
+    parser.add_argument('--both', nargs='+', metavar='DATABASE', default=None,
+                        help="only count the records that are in all the given databases")
+    parser.add_argument('--write', nargs=2, metavar=('DATABASE', 'PATH'), default=None,
+                        help="write one database from the store to a separate file")
+    add_arguments(parser)
+    arguments = parser.parse_args()
+    if arguments.export not in exports:
+        parser.error("unknown export: " + arguments.export)
+
+    (file_path, routes, outputs, record_filter) = exports[arguments.export]
+    path = arguments.output or store_path(arguments.export)
+    if arguments.both or arguments.write:
+        with RecordStore(path) as store:
+            if arguments.both:
+                print("Records in " + " and ".join(arguments.both) + ": " + str(store.count_members(*arguments.both)))
+            if arguments.write:
+                store.write_database(*arguments.write)
+                print("Database " + arguments.write[0] + " written to " + arguments.write[1])
+    else:
+        with run_from_arguments('store ' + arguments.export, arguments, file_size(file_path)) as run:
+            (counts, stats) = build_store(file_path, routes, path, record_filter, arguments.processes or None, run)
+        for (name, count) in counts.items():
+            print("Database " + name + " has " + str(count) + " records.")
+        print("Records stored: " + str(stats['records']) + "; copies avoided: " + str(stats['copies avoided'])
+              + " (" + str(stats['bytes avoided']) + " bytes)")
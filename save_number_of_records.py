@@ -1,5 +1,6 @@
 import pandas as pd
-from pymarc import MARCReader
+
+from mrc_index import open_index, count_records, year_range
 
 path = "data/uclo/uclo_"
 
@@ -16,34 +17,18 @@ out_trl = 'trl'
 databases = [out_1945, out_alkaro, out_ret, out_smz, out_int, out_cle_I, out_cle_II, out_trl]
 
 
+# Pocet zaznamu a rozsah let zjistime z indexu (viz mrc_index.py), ktery vznika pri deleni databazi.
+# Pokud index chybi, sestavi se z navesti a adresaru zaznamu, bez nacitani celych zaznamu
 def number_of_records(database):
     
-    with open(database, 'rb') as data:
-        # Nacteni marcu
-        reader = MARCReader(data)
-        
-        counter = 0
-        
-        newest = 0000
-        
-        oldest = 2024
-        
-        for record in reader:
-            for field in record.get_fields('008'):
-                
-                year = field.data[slice(7,11, None)]
-                
-                if year.isnumeric():
-                    
-                    year = int(year)
-                    
-                    if year < oldest:
-                        oldest = year
-                
-                    if newest < year:
-                        newest = year    
-            
-            counter += 1
+    index = open_index(database)
+    
+    counter = count_records(index)
+    
+    (oldest, newest) = year_range(index)
+    
+    if oldest is None:
+        (oldest, newest) = (2024, 0000)
        
     return (counter, oldest, newest) 
 
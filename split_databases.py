@@ -0,0 +1,326 @@
+import argparse
+import json
+import os
+import re
+
+from pymarc import map_xml
+
+from compressed_io import input_position, is_compressed, open_input
+from instrumentation import Run, add_arguments, error_entry, file_size, run_from_arguments
+from marc_sinks import WriterPool, open_sink, resumable, sink_type
+from parallel_xml import chunk_size, find_chunks, map_chunks
+
+
+# regex pattern, ktery najde cislo zaznamu za zavorkou v poli 035, napr. '(CLE)1000123'
+pattern_cle = re.compile(r'\)(.*)')
+
+
+# Zaznam patri do bibliografie CLB, pokud ma v poli 599 hodnotu 'CLB-CPK'
+def is_clb(r):
+    return any('CLB-CPK' in field.value() for field in r.get_fields('599'))
+
+
+# Cisla z pole 035, podle kterych se CLE deli na dve casti
+def cle_numbers(r):
+    numbers = []
+    for field in r.get_fields('035'):
+        match = pattern_cle.search(field.value())
+        if match and len(match.group(1)) > 0:
+            numbers.append(match.group(1))
+    return numbers
+
+
+def is_cle_I(r):
+    return any(n.startswith(('1', '001')) for n in cle_numbers(r))
+
+
+def is_cle_II(r):
+    return any(n.startswith(('2', '002')) for n in cle_numbers(r))
+
+
+# Smerovaci tabulky. Kazdy tuple je (nazev databaze, kody z pole 964$a, dalsi podminka nebo None).
+# Nazev databaze se dosadi do sablon vystupnich souboru, napr. 'data/ucla/ucla_{}.mrc'
+routes_ucla = [('B', ['B12', 'B45', 'B97', 'B70', 'B80'], None),
+               ('ret', ['RET'], None),
+               ('smz', ['SMZ'], None),
+               ('int', ['INT'], None),
+               ('cle', ['CLE'], None),
+               ('trl', ['TRL'], None)]
+
+routes_uclo = [('1945', ['B12', 'B45', 'B70', 'B80', 'B97', 'CLE', 'SMZ', 'INT'], None),
+               ('alkaro', ['ALKARO'], None),
+               ('ret', ['RET'], None),
+               ('smz', ['SMZ'], None),
+               ('int', ['INT'], None),
+               ('cle_I', ['CLE'], is_cle_I),
+               ('cle_II', ['CLE'], is_cle_II),
+               ('trl', ['TRL'], None)]
+
+# Exporty z katalogu: (vstupni soubor, smerovaci tabulka, vystupy, podminka pro cely zaznam).
+# Tabulky ze split (sloupce podle field_list) jsou v data/csv/split, aby neprepsaly tabulky
+# z load_mrc_and_save_csv.py, ktere maji jine sloupce
+exports = {'ucla': ('data/ucla.xml', routes_ucla,
+                    ['data/ucla/ucla_{}.mrc', 'data/ucla/ucla_{}.mrk', 'data/csv/split/ucla_{}.csv'],
+                    None),
+           'uclo': ('data/uclo.xml', routes_uclo,
+                    ['data/uclo/uclo_{}.mrc'],
+                    is_clb)}
+
+
+# Vrati nazvy databazi, do kterych zaznam patri, a kolikrat by se zaznam do techto databazi
+# zapsal navic, kdybychom ho zapisovali pro kazde odpovidajici pole 964 zvlast
+def route_record(r, routes):
+    codes = [field['a'] for field in r.get_fields('964')]
+    names = []
+    duplicates = 0
+    for (name, database_codes, predicate) in routes:
+        matches = sum(1 for code in codes if code in database_codes)
+        if matches > 0 and (predicate is None or predicate(r)):
+            names.append(name)
+            duplicates += matches - 1
+    return (names, duplicates)
+
+
+# Pripravi zaznam k zapisu a vrati nazvy databazi, do kterych se ma zapsat
+def select_databases(r, routes, record_filter=None):
+    if record_filter is not None and not record_filter(r):
+        return ([], 0)
+    r.remove_fields('LDR', 'FMT')
+    return route_record(r, routes)
+
+
+def new_stats():
+    return {'records': 0, 'writes': 0, 'serializations': 0, 'duplicate writes avoided': 0}
+
+
+def add_stats(stats, other):
+    for key, value in other.items():
+        stats[key] += value
+
+
+# Zpracovani jednoho kusu souboru v paralelnim rezimu. Zaznamy se rovnou serializuji,
+# hlavni proces je pak jen zapise do souboru ve stejnem poradi. Chyby se vraci jako slovniky
+# (viz instrumentation.py) a zapise je az hlavni proces
+def split_chunk(records, routes, outputs, record_filter):
+    types = [sink_type(output) for output in outputs]
+    serialized = {name: [[] for _ in outputs] for (name, _, _) in routes}
+    counts = {name: 0 for (name, _, _) in routes}
+    stats = new_stats()
+    errors = []
+    for r in records:
+        try:
+            (names, duplicates) = select_databases(r, routes, record_filter)
+            if not names:
+                continue
+            # Kazdy format serializujeme jen jednou a stejna data zapiseme do vsech databazi
+            cache = {}
+            for name in names:
+                for i, t in enumerate(types):
+                    if t not in cache:
+                        cache[t] = t.serialize(r)
+                    serialized[name][i].append(cache[t])
+                counts[name] += 1
+            stats['records'] += 1
+            stats['writes'] += len(names) * len(types)
+            stats['serializations'] += len(cache)
+            stats['duplicate writes avoided'] += duplicates * len(types)
+        except Exception as error:
+            errors.append(error_entry(error, r))
+    return (serialized, counts, stats, errors, len(records))
+
+
+# Pocet vlaken, ktera zapisuji vystupy
+writer_threads = 2
+
+
+# Cesta ke checkpointu exportu
+def checkpoint_path(export):
+    return 'data/checkpoint_{}.json'.format(export)
+
+
+# Checkpoint se zapise do docasneho souboru a pak prejmenuje, aby nikdy nebyl zapsany jen napul
+def save_checkpoint(path, state):
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf8') as file:
+        json.dump(state, file, ensure_ascii=False, indent=1)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+# Nacte checkpoint (nebo None, pokud neexistuje). Checkpoint musi patrit ke stejnemu vstupnimu souboru
+def load_checkpoint(path, file_path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf8') as file:
+        state = json.load(file)
+    status = os.stat(file_path)
+    if state['input'] != file_path or state['input size'] != status.st_size or state['input mtime'] != status.st_mtime_ns:
+        raise ValueError("Checkpoint " + path + " belongs to a different input, remove it to start again")
+    return state
+
+
+# Jeden pruchod pres MARCXML, ktery zapise zaznamy do vsech vystupu najednou.
+# Pri processes > 1 se soubor rozdeli na kusy a ty se zpracuji paralelne.
+# Funkce observer(r, names) se zavola pro kazdy zaznam (jen pri processes == 1 a bez checkpointu).
+# Prubeh, casy a chyby sleduje run (viz instrumentation.py), bez nej se vytvori vychozi.
+#
+# S checkpoint (cesta k .json) se soubor zpracovava po kusech (viz parallel_xml.py) a po kazdem kusu
+# se vystupy zapisou na disk a do checkpointu se ulozi pozice dalsiho kusu, pocty a delky vystupu.
+# S resume=True se vystupy zkrati na delky z checkpointu a pokracuje se od ulozene pozice.
+# Po dokonceni se vystupy zapisou na disk (fsync) a checkpoint se smaze.
+# Komprimovany vstup (napr. data/ucla.xml.gz) se cte jednim pruchodem, rozbaluje se ve vlakne
+# na pozadi. Na kusy ho rozdelit nejde, takze se zpracovava jen v jednom procesu a bez checkpointu.
+# Vraci pocty zaznamu v jednotlivych databazich a statistiky zapisu
+def split(file_path, routes, outputs, record_filter=None, processes=1, observer=None, run=None,
+          checkpoint=None, resume=False):
+    if observer is not None and (processes != 1 or checkpoint is not None):
+        raise ValueError("observer is only supported with processes=1 and without checkpoints")
+    if is_compressed(file_path) and (processes != 1 or checkpoint is not None):
+        raise ValueError("compressed input is only supported with processes=1 and without checkpoints")
+    if checkpoint is not None and not all(resumable(output) for output in outputs):
+        raise ValueError("checkpoints are not supported for these outputs: " + ", ".join(outputs))
+    own_run = run is None
+    if own_run:
+        run = Run('split ' + file_path, file_size(file_path))
+
+    state = load_checkpoint(checkpoint, file_path) if checkpoint is not None and resume else None
+    paths = [output.format(name) for (name, _, _) in routes for output in outputs]
+    if state is not None:
+        if sorted(state['outputs']) != sorted(paths):
+            raise ValueError("Checkpoint " + checkpoint + " was written for different outputs")
+        print("Resuming " + file_path + " from byte " + str(state['offset']) + " (" + str(state['read'])
+              + " records read)")
+    lengths = state['outputs'] if state is not None else {}
+
+    sinks = {}
+    for (name, _, _) in routes:
+        sinks[name] = [open_sink(output.format(name), lengths.get(output.format(name))) for output in outputs]
+    # Zapis bezi ve vlaknech na pozadi (viz marc_sinks.py), parsovani na nej neceka
+    writer = WriterPool([sink for database_sinks in sinks.values() for sink in database_sinks], writer_threads)
+
+    counts = dict(state['counts']) if state is not None else {name: 0 for name in sinks}
+    stats = dict(state['stats']) if state is not None else new_stats()
+    read = state['read'] if state is not None else 0
+    complete = False
+
+    def save_databases(r):
+        run.lap('parse')
+        try:
+            (names, duplicates) = select_databases(r, routes, record_filter)
+            if observer is not None:
+                observer(r, names)
+            run.lap('route')
+            if not names:
+                run.record(position=input_position(xml_file))
+                return
+            # Kazdy format serializujeme jen jednou a stejna data zapiseme do vsech databazi
+            cache = {}
+            for name in names:
+                for sink in sinks[name]:
+                    t = type(sink)
+                    if t not in cache:
+                        cache[t] = sink.serialize(r)
+                    writer.write(sink, cache[t])
+                counts[name] += 1
+            stats['records'] += 1
+            stats['writes'] += len(names) * len(outputs)
+            stats['serializations'] += len(cache)
+            stats['duplicate writes avoided'] += duplicates * len(outputs)
+            for name in names:
+                run.count(name)
+        except Exception as error:
+            run.error(error, r)
+        run.lap('write')
+        run.record(position=input_position(xml_file))
+
+    try:
+        if processes == 1 and checkpoint is None:
+            with open_input(file_path) as xml_file:
+                map_xml(save_databases, xml_file)
+        else:
+            size = state['chunk size'] if state is not None else chunk_size
+            (header, footer, chunks) = find_chunks(file_path, size)
+            if state is not None:
+                chunks = [(start, end) for (start, end) in chunks if start >= state['offset']]
+                if chunks and chunks[0][0] != state['offset']:
+                    raise ValueError("Checkpoint offset " + str(state['offset']) + " is not a chunk boundary")
+            args = (routes, outputs, record_filter)
+            results = map_chunks(split_chunk, file_path, header, footer, chunks, processes, args)
+            for ((start, end), (serialized, chunk_counts, chunk_stats, errors, chunk_read)) in zip(chunks, results):
+                # Cekani na dalsi kus je cas, kdy se ctou a serializuji zaznamy
+                run.lap('parse')
+                for name, items in serialized.items():
+                    for sink, data in zip(sinks[name], items):
+                        writer.write_batch(sink, data)
+                add_stats(counts, chunk_counts)
+                add_stats(stats, chunk_stats)
+                read += chunk_read
+                run.counters.update(chunk_counts)
+                for entry in errors:
+                    run.log(entry)
+                run.lap('write')
+                if checkpoint is not None:
+                    save_checkpoint(checkpoint, {'input': file_path,
+                                                 'input size': os.path.getsize(file_path),
+                                                 'input mtime': os.stat(file_path).st_mtime_ns,
+                                                 'chunk size': size,
+                                                 'offset': end,
+                                                 'read': read,
+                                                 'counts': counts,
+                                                 'stats': stats,
+                                                 'outputs': writer.checkpoint()})
+                    run.lap('checkpoint')
+                run.record(chunk_read, position=end)
+        complete = True
+    except Exception as error:
+        # Chyba se zapise do logu a preda dal, nedokonceny split nesmi vypadat jako hotovy
+        run.error(error)
+        raise
+    finally:
+        close_error = None
+        try:
+            # S checkpointem musi byt vystupy na disku (fsync) driv, nez se checkpoint smaze
+            writer.close(sync=checkpoint is not None)
+        except Exception as error:
+            close_error = error
+            run.error(error)
+        if complete and close_error is None and checkpoint is not None and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        if own_run:
+            run.close()
+        if complete and close_error is not None:
+            raise close_error
+    return (counts, stats)
+
+
+# Vypise pocty zaznamu a kolik zapisu a serializaci jsme si usetrili
+def print_report(counts, stats):
+    for name, count in counts.items():
+        print("Database " + name + " has " + str(count) + " records.")
+    print("Records written: " + str(stats['records']))
+    print("Writes: " + str(stats['writes']) + "; serializations: " + str(stats['serializations'])
+          + " (" + str(stats['writes'] - stats['serializations']) + " avoided)")
+    print("Duplicate writes avoided: " + str(stats['duplicate writes avoided']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Split catalogue exports into databases.")
+    parser.add_argument('exports', nargs='*', help="exports to split: " + ", ".join(exports) + " (default: all)")
+    parser.add_argument('--processes', type=int, default=1, help="number of worker processes (0 = all cores)")
+    parser.add_argument('--resume', action='store_true', help="continue from the last checkpoint")
+    parser.add_argument('--no-checkpoint', action='store_true', help="do not write checkpoints")
+    add_arguments(parser)
+    arguments = parser.parse_args()
+    for export in arguments.exports:
+        if export not in exports:
+            parser.error("unknown export: " + export)
+
+    for export in arguments.exports or list(exports):
+        (file_path, routes, outputs, record_filter) = exports[export]
+        with run_from_arguments('split ' + export, arguments, file_size(file_path)) as run:
+            checkpoint = None if arguments.no_checkpoint or is_compressed(file_path) else checkpoint_path(export)
+            processes = 1 if is_compressed(file_path) else arguments.processes or None
+            (counts, stats) = split(file_path, routes, outputs, record_filter, processes, run=run,
+                                    checkpoint=checkpoint, resume=arguments.resume)
+        print_report(counts, stats)
@@ -0,0 +1,114 @@
+import sqlite3
+
+import pandas as pd
+
+from geocoding import Geocoder, TableBackend, join_coordinates, table_places
+from marc_fields import normalize_place
+
+
+# Mistni nahrada hledaci sluzby: souradnice ze slovniku, pamatuje si vsechny dotazy
+class LocalBackend:
+    def __init__(self, coordinates, name='local'):
+        self.coordinates = coordinates
+        self.name = name
+        self.calls = []
+
+    def geocode(self, places):
+        self.calls.append(list(places))
+        return {place: self.coordinates.get(place) for place in places}
+
+
+coordinates = {'Londýn': (51.5, -0.13), 'Paříž': (48.86, 2.35), 'Mnichov': (48.14, 11.58)}
+
+
+def test_resolve_uses_cache(tmp_path):
+    backend = LocalBackend(coordinates)
+    geocoder = Geocoder(backend, str(tmp_path / 'cache.sqlite'))
+    assert geocoder.resolve(['Londýn', 'Paříž', 'Londýn']) == {'Londýn': (51.5, -0.13), 'Paříž': (48.86, 2.35)}
+    assert geocoder.resolve(['Paříž', 'Londýn']) == {'Paříž': (48.86, 2.35), 'Londýn': (51.5, -0.13)}
+    assert backend.calls == [['Londýn', 'Paříž']]
+    geocoder.close()
+
+    # Cache zustava i po znovuotevreni
+    geocoder = Geocoder(backend, str(tmp_path / 'cache.sqlite'))
+    geocoder.resolve(['Londýn'])
+    assert backend.calls == [['Londýn', 'Paříž']]
+    geocoder.close()
+
+
+def test_missing_places_are_batched(tmp_path):
+    backend = LocalBackend(coordinates)
+    geocoder = Geocoder(backend, str(tmp_path / 'cache.sqlite'), batch_size=2)
+    geocoder.resolve(['Londýn', 'Paříž', 'Mnichov', 'Atlantida', 'Londýn'])
+    assert backend.calls == [['Londýn', 'Paříž'], ['Mnichov', 'Atlantida']]
+    geocoder.close()
+
+
+def test_unresolved_places_are_cached_until_retry(tmp_path):
+    backend = LocalBackend(coordinates)
+    geocoder = Geocoder(backend, str(tmp_path / 'cache.sqlite'))
+    assert geocoder.resolve(['Atlantida']) == {'Atlantida': None}
+    assert geocoder.unresolved() == ['Atlantida']
+    geocoder.resolve(['Atlantida'])
+    assert len(backend.calls) == 1
+
+    backend.coordinates = dict(coordinates, Atlantida=(0.0, 0.0))
+    assert geocoder.resolve(['Atlantida'], retry=True) == {'Atlantida': (0.0, 0.0)}
+    assert geocoder.unresolved() == []
+    geocoder.close()
+
+
+def test_cache_is_separate_for_each_backend(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    local = LocalBackend({'Londýn': (51.5, -0.13)}, name='table')
+    geocoder = Geocoder(local, path)
+    assert geocoder.resolve(['Londýn', 'Winterthur']) == {'Londýn': (51.5, -0.13), 'Winterthur': None}
+    geocoder.close()
+
+    # Misto, ktere mistni tabulka nezna, jina sluzba hleda znovu
+    online = LocalBackend({'Winterthur': (47.5, 8.72)}, name='online')
+    geocoder = Geocoder(online, path)
+    assert geocoder.resolve(['Winterthur']) == {'Winterthur': (47.5, 8.72)}
+    assert online.calls == [['Winterthur']]
+    geocoder.close()
+
+
+def test_old_cache_is_migrated(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE places (place TEXT PRIMARY KEY, latitude REAL, longitude REAL, source TEXT, stamp REAL)')
+    connection.execute("INSERT INTO places VALUES ('Paříž', 48.86, 2.35, 'local', 0)")
+    connection.execute("INSERT INTO places VALUES ('Mnichov', NULL, NULL, 'table', 0)")
+    connection.commit()
+    connection.close()
+
+    backend = LocalBackend(coordinates)
+    geocoder = Geocoder(backend, path)
+    assert geocoder.resolve(['Paříž', 'Mnichov']) == {'Paříž': (48.86, 2.35), 'Mnichov': (48.14, 11.58)}
+    assert backend.calls == [['Mnichov']]
+    geocoder.close()
+
+
+def test_table_backend(tmp_path):
+    path = tmp_path / 'coordinates.csv'
+    pd.DataFrame({'city': ['Londýn', 'Řím'], 'latitude': [51.5, 41.9], 'longitude': [-0.13, 12.5]}).to_csv(path, index=False)
+    geocoder = Geocoder(TableBackend(str(path)), str(tmp_path / 'cache.sqlite'))
+    df = join_coordinates(pd.DataFrame({'city': ['Řím', 'Atlantida'], 'number of records': [3, 1]}), geocoder)
+    assert df['latitude'].tolist()[0] == 41.9
+    assert pd.isna(df['latitude'].tolist()[1])
+    assert geocoder.unresolved() == ['Atlantida']
+    geocoder.close()
+
+
+def test_aliases():
+    assert normalize_place('London') == ['Londýn']
+    assert normalize_place('Köln-Ehrenfeld') == ['Kolín nad Rýnem']
+    assert normalize_place('New York-Paříž') == ['New York', 'Paříž']
+    assert normalize_place(' Řím ') == ['Řím']
+
+
+def test_table_places():
+    df = pd.DataFrame({'magazine': [['Svědectví (Paříž)'], ['Listy (Řím)', 'Text'], []]})
+    assert table_places(df) == ['Paříž', 'Řím']
+    df = pd.DataFrame({'place': [['Londýn'], ['New York', 'Paříž']]})
+    assert table_places(df) == ['Londýn', 'New York', 'Paříž']
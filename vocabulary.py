@@ -0,0 +1,227 @@
+import argparse
+import os
+from array import array
+
+import numpy as np
+from pymarc import MARCReader
+
+from compressed_io import open_input
+from marc_table import missing_year, year_array
+from ragged import ragged
+
+# Zaznamy jako cisla misto opakovanych stringu. Pro kazdy sloupec (facet) se sestavi slovnik
+# hodnota <-> int32 id. U autoru a osobnosti je klicem autoritni kod z podpole $7 (pokud ho
+# pole ma), takze ruzne zapsana jmena jedne osoby maji stejne id. Hodnoty zaznamu jsou pak
+# v jednom poli id a pole offsets rika, kde zacinaji hodnoty jednotlivych zaznamu
+# (hodnoty zaznamu i jsou ids[offsets[i]:offsets[i + 1]]).
+
+# (nazev sloupce, tag pole, podpole s hodnotou, podpole s autoritnim kodem nebo None)
+facets = [('author', '100', 'a', '7'),
+          ('figures', '600', 'a', '7'),
+          ('description', '650', 'a', None),
+          ('genre', '655', 'a', None),
+          ('magazine', '773', 't', None)]
+
+# U jmen chceme jmeno a prijmeni bez koncove carky ',' (stejne jako clean_record)
+strip_chars = {'author': ' ,', 'figures': ' ,'}
+
+
+class Vocabulary:
+    def __init__(self, keys=(), labels=()):
+        self.keys = list(keys)
+        self.labels = list(labels)
+        self.ids = {key: i for i, key in enumerate(self.keys)}
+        self.names = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Id hodnoty. Klicem je autoritni kod, pokud ho mame, jinak samotna hodnota.
+    # Jako popisek (label) se pamatuje prvni zapis jmena
+    def encode(self, name, code=None):
+        key = code or name
+        i = self.ids.get(key)
+        if i is None:
+            i = len(self.keys)
+            self.ids[key] = i
+            self.keys.append(key)
+            self.labels.append(name)
+            self.names = None
+        return i
+
+    # Vsechna id hodnoty: id s klicem value (autoritni kod nebo jmeno) a id vsech hodnot se stejnym
+    # popiskem. Osoba, ktera je v nekterych zaznamech s kodem $7 a v jinych bez nej, ma dve id
+    # a jmeno najde obe. Prazdny list, pokud hodnota ve slovniku neni
+    def lookup(self, value):
+        if self.names is None:
+            self.names = {}
+            for j, label in enumerate(self.labels):
+                self.names.setdefault(label, []).append(j)
+        ids = set(self.names.get(value, []))
+        i = self.ids.get(value)
+        if i is not None:
+            ids.add(i)
+        return sorted(ids)
+
+    def decode(self, ids):
+        return [self.labels[i] for i in ids]
+
+
+class EncodedColumn:
+    def __init__(self, ids, offsets, vocabulary):
+        self.ids = ids
+        self.offsets = offsets
+        self.vocabulary = vocabulary
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    # Cislo zaznamu pro kazdou hodnotu v ids
+    def rows(self):
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+    def row(self, i):
+        return self.ids[self.offsets[i]:self.offsets[i + 1]]
+
+    # Maska zaznamu, ktere obsahuji aspon jednu z hodnot (id, jmeno nebo autoritni kod)
+    def contains(self, *values):
+        ids = []
+        for value in values:
+            ids.extend([value] if isinstance(value, (int, np.integer)) else self.vocabulary.lookup(value))
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.rows()[np.isin(self.ids, ids)]] = True
+        return mask
+
+    # Pocet vyskytu kazdeho id
+    def value_counts(self):
+        return np.bincount(self.ids, minlength=len(self.vocabulary))
+
+    # Zpet na listy stringu (napr. pro sloupec DataFramu)
+    def to_lists(self):
+        labels = np.array(self.vocabulary.labels, dtype=object)
+        return [list(labels[self.row(i)]) for i in range(len(self))]
+
+
+# Postupne sestavuje jeden zakodovany sloupec
+class ColumnBuilder:
+    def __init__(self, vocabulary=None):
+        self.vocabulary = Vocabulary() if vocabulary is None else vocabulary
+        self.ids = array('i')
+        self.offsets = array('q', [0])
+
+    # Hodnoty jednoho zaznamu jako list (jmeno, kod)
+    def add(self, values):
+        for (name, code) in values:
+            self.ids.append(self.vocabulary.encode(name, code))
+        self.offsets.append(len(self.ids))
+
+    def to_column(self):
+        return EncodedColumn(np.frombuffer(self.ids, dtype=np.int32).copy(),
+                             np.frombuffer(self.offsets, dtype=np.int64).copy(), self.vocabulary)
+
+
+class EncodedTable:
+    def __init__(self, year, columns):
+        self.year = year
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.year)
+
+    def __getitem__(self, facet):
+        return self.columns[facet]
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        arrays = {'year': self.year}
+        for (facet, column) in self.columns.items():
+            arrays[facet + '.ids'] = column.ids
+            arrays[facet + '.offsets'] = column.offsets
+            arrays[facet + '.keys'] = np.array(column.vocabulary.keys, dtype=str)
+            arrays[facet + '.labels'] = np.array(column.vocabulary.labels, dtype=str)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            names = [name[:-len('.ids')] for name in data.files if name.endswith('.ids')]
+            columns = {}
+            for facet in names:
+                vocabulary = Vocabulary(data[facet + '.keys'].tolist(), data[facet + '.labels'].tolist())
+                columns[facet] = EncodedColumn(data[facet + '.ids'], data[facet + '.offsets'], vocabulary)
+            return cls(data['year'], columns)
+
+
+# Hodnoty (jmeno, autoritni kod) jednoho facetu ze zaznamu
+def facet_values(record, facet):
+    (column, tag, subfield, code_subfield) = facet
+    values = []
+    for field in record.get_fields(tag):
+        if field.control_field:
+            continue
+        name = field.get(subfield)
+        if name is None:
+            continue
+        if column in strip_chars and len(name) > 0:
+            name = name.strip(strip_chars[column])
+        code = field.get(code_subfield) if code_subfield is not None else None
+        values.append((name, code))
+    return values
+
+
+def record_year(record):
+    fields = record.get_fields('008')
+    if fields and fields[0].data[7:11].isdigit():
+        return int(fields[0].data[7:11])
+    return missing_year
+
+
+# Zakoduje zaznamy (pymarc Record). Slovniky lze predat, aby vice databazi sdilelo stejna id
+def encode_records(records, facets=facets, vocabularies=None):
+    vocabularies = vocabularies or {}
+    builders = {facet[0]: ColumnBuilder(vocabularies.get(facet[0])) for facet in facets}
+    years = array('h')
+    for record in records:
+        if record is None:
+            continue
+        years.append(record_year(record))
+        for facet in facets:
+            builders[facet[0]].add(facet_values(record, facet))
+    return EncodedTable(np.frombuffer(years, dtype=np.int16).copy(),
+                        {column: builder.to_column() for (column, builder) in builders.items()})
+
+
+def encode_file(mrc_path, facets=facets, vocabularies=None):
+    with open_input(mrc_path) as data:
+        return encode_records(MARCReader(data), facets, vocabularies)
+
+
+# Zakoduje sloupec DataFramu s listy hodnot nebo Ragged (viz ragged.py), bez autoritnich kodu.
+# Ragged uz hodnoty jako kody ma, staci je prevest na id ve slovniku
+def encode_column(values, vocabulary=None):
+    vocabulary = Vocabulary() if vocabulary is None else vocabulary
+    values = ragged(values).compact()
+    mapping = np.fromiter((vocabulary.encode(label) for label in values.labels), dtype=np.int32,
+                          count=len(values.labels))
+    return EncodedColumn(mapping[values.codes], values.offsets.copy(), vocabulary)
+
+
+# Zakoduje vybrane sloupce DataFramu (viz load_table) vcetne roku
+def encode_frame(df, columns):
+    return EncodedTable(year_array(df['year']), {column: encode_column(df[column]) for column in columns})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Encode records of a .mrc file as integer id arrays.")
+    parser.add_argument('mrc', help="input .mrc file")
+    parser.add_argument('--output', default=None, help="output .npz (default: data/encoded/<name>.npz)")
+    arguments = parser.parse_args()
+
+    output = arguments.output or os.path.join('data/encoded', os.path.splitext(os.path.basename(arguments.mrc))[0] + '.npz')
+    table = encode_file(arguments.mrc)
+    table.save(output)
+    print("Encoded " + str(len(table)) + " records -> " + output)
+    for (facet, column) in table.columns.items():
+        print("  " + facet + ": " + str(len(column.ids)) + " values, " + str(len(column.vocabulary)) + " distinct")